@@ -1,19 +1,74 @@
 # app.py
-import os
-import threading
-from flask import Flask, request, jsonify, render_template
-from services.event_service import EventService
+import json
+import time
+from flask import Flask, Response, request, jsonify, render_template
+from flask.json.provider import DefaultJSONProvider
+from services.snapshot import SNAPSHOT_AGE
+from services.response_cache import CachedBody
+from services import json_codec, live_views, metrics, profiling, push_codec
+# настройки (SECRET_TOKEN, SNAPSHOT_DIR, JOURNAL_DIR, HISTORY_DIR...), снимки и кэши таблиц —
+# общие с app_async.py, в services/live_views.py
+from services.live_views import SECRET_TOKEN, STREAM_KEEPALIVE
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON-провайдер Flask на json_codec.dumps(): jsonify() отдаёт готовые bytes без промежуточной строки.
+    Порядок ключей сохраняется (sort_keys не применяется).
+    """
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return json_codec.dumps(obj, default=self.default).decode("utf-8")
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(json_codec.dumps(obj, default=self.default), mimetype=self.mimetype)
 
 app = Flask(__name__, template_folder="templates", static_folder="static")
-
-#  :     VPS   docker run: -e SECRET_TOKEN=_
-SECRET_TOKEN = os.environ.get("SECRET_TOKEN", "changeme_replace")
-
-#      
-_latest_lock = threading.Lock()
-_latest_payload = None  #   dict: {"event_xml": "...", "results": {"raceid_rank": "...", ...}}
-
-event_svc = EventService()
+# jsonify через orjson (если установлен) — сразу в bytes, кириллица без экранирования
+app.json = FastJSONProvider(app)
+
+def _conditional(etag, make_response):
+    """Ответ с ETag: 304 без тела, если клиент прислал тот же If-None-Match."""
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+    else:
+        resp = make_response()
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+def _send_cached(body):
+    """Ответ из CachedBody: gzip/br, если клиент их принимает."""
+    encoding, data = body.negotiate(request.accept_encodings)
+    resp = app.response_class(data, mimetype="application/json")
+    if encoding:
+        resp.headers["Content-Encoding"] = encoding
+    resp.headers["Vary"] = "Accept-Encoding"
+    return resp
+
+@app.before_request
+def _start_metrics():
+    metrics.start_request()
+
+@app.after_request
+def _finish_metrics(resp):
+    # по шаблону маршрута, а не пути — иначе у метрики неограниченно много меток
+    endpoint = request.url_rule.rule if request.url_rule is not None else "other"
+    resp.headers["Server-Timing"] = metrics.finish_request(endpoint, resp.status_code)
+    return resp
+
+if profiling.ENABLED:
+    # PROFILE_DIR задан — ?profile=<PROFILE_TOKEN> профилирует запрос (см. services/profiling.py)
+    @app.before_request
+    def _start_profiling():
+        profiling.start_request(request.args.get("profile", ""))
+
+@app.route("/metrics")
+def metrics_page():
+    """Метрики процесса в формате Prometheus."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route("/")
 def index_page():
@@ -26,9 +81,10 @@ def race_page():
 
 @app.route("/api/push", methods=["POST"])
 def receive_push():
-    """  JSON: { "event_xml": "<xml...>", "results": { "raceid_1": "<xml...>", ... } }"""
-    global _latest_payload
-    #  
+    """Агент посылает JSON: { "event_xml": "<xml...>", "results": { "raceid_1": "<xml...>", ... } }
+       или дельту с "hashes" — тогда тела есть только у изменившихся документов.
+       Тело может быть сжато: Content-Encoding gzip или zstd (см. services/push_codec.py)."""
+    # проверяем токен
     auth = request.headers.get("Authorization", "")
     if not auth.startswith("Bearer "):
         return jsonify({"error": "unauthorized"}), 401
@@ -36,47 +92,128 @@ def receive_push():
     if token != SECRET_TOKEN:
         return jsonify({"error": "forbidden"}), 403
 
-    data = request.get_json()
-    if not data:
-        return jsonify({"error": "bad request"}), 400
-
-    with _latest_lock:
-        _latest_payload = data
-
-    return jsonify({"status": "ok"})
+    try:
+        with metrics.stage("decode"):
+            body, wire_size = push_codec.decode_body(request.stream, request.headers.get("Content-Encoding"),
+                                                     live_views.PUSH_MAX_SIZE)
+            data = json.loads(body)
+    except push_codec.UnsupportedEncoding:
+        # агент перейдёт на другое сжатие из Accept-Encoding
+        return jsonify({"error": "unsupported encoding"}), 415, {
+            "Accept-Encoding": ", ".join(push_codec.accepted_encodings())}
+    except push_codec.PushTooLarge:
+        return jsonify({"error": "too large"}), 413
+    except ValueError:
+        data = wire_size = None
+    status, result = live_views.accept_push(data, wire_size)
+    return jsonify(result), status
 
 @app.route("/api/dates")
 def api_dates():
-    """    (    payload)."""
-    with _latest_lock:
-        payload = _latest_payload
-    if not payload:
+    """Возвращает даты и гонки (берёт данные из последнего payload)."""
+    snapshot = live_views.snapshots.current()
+    if snapshot is None:
         return jsonify({"error": "no data"}), 404
 
-    parsed = event_svc.parse_eventdata_from_payload(payload)
-    dates = event_svc.group_dates(parsed)
-    return jsonify({"title": parsed.get("title", ""), "dates": dates})
+    return _conditional(live_views.version_tag(snapshot.version),
+                        lambda: jsonify({"title": snapshot.title, "dates": snapshot.dates}))
 
 @app.route("/api/live")
+@profiling.profiled("api_live")
 def api_live():
-    """     .
-       : race, cat ()."""
+    """Возвращает разобранную таблицу для выбранной гонки.
+       Параметры: race, cat (опционально);
+       страница: offset, limit, around (номер участника в середине окна),
+       format=columns — строки колонками ("columns" + "values").
+       Без offset/limit/around/format — вся таблица в прежнем формате.
+       at — таблица на момент at (unix-время или ISO 8601) из истории HISTORY_DIR."""
     race = request.args.get("race", "")
     cat = request.args.get("cat", "")
+    page = live_views.page_args(request.args)
 
-    with _latest_lock:
-        payload = _latest_payload
-    if not payload:
-        return jsonify({})
+    if "at" in request.args:
+        return _live_at(race, cat, request.args["at"], page)
 
-    parsed = event_svc.parse_eventdata_from_payload(payload)
-    result = event_svc.build_live_from_payload(parsed, payload, race_id=race, cat_filter=cat)
-    return jsonify(result)
+    snapshot = live_views.snapshots.current()
+    if snapshot is None:
+        return jsonify({})
+    SNAPSHOT_AGE.observe(time.time() - snapshot.created_at)
+
+    return _conditional(live_views.live_etag(live_views.version_tag(snapshot.version), race, cat, page),
+                        lambda: _send_cached(live_views.live_body(snapshot, race, cat, page)))
+
+def _live_at(race, cat, at, page):
+    if live_views.history is None:
+        return jsonify({"error": "history disabled"}), 404
+    when = live_views.parse_time(at)
+    if when is None:
+        return jsonify({"error": "bad at"}), 400
+    snapshot = live_views.history.snapshot_at(when)
+    if snapshot is None:
+        return jsonify({})
+    return _conditional(live_views.history_etag(snapshot, race, cat, page), lambda: _send_cached(
+        CachedBody(live_views.history_body(snapshot, live_views.history_live(snapshot, race, cat, page)))))
+
+@app.route("/api/live/replay")
+def api_live_replay():
+    """Повтор гонки из истории SSE-потоком: событие "live" на каждое изменение таблицы.
+       Параметры: race, cat (опционально); from, to — интервал (unix-время или ISO 8601);
+       speed — во сколько раз быстрее реального времени (по умолчанию 10).
+       В конце — событие "end"."""
+    if live_views.history is None:
+        return jsonify({"error": "history disabled"}), 404
+    args = live_views.replay_args(request.args)
+    if args is None:
+        return jsonify({"error": "bad request"}), 400
+    race, cat, start, end, speed = args
+    timeline = live_views.replay_timeline(start, end)
+
+    def generate():
+        previous_time = previous_live = None
+        for created_at in timeline:
+            time.sleep(live_views.replay_pause(previous_time, created_at, speed))
+            previous_time = created_at
+            _snapshot, previous_live, event = live_views.replay_frame(created_at, race, cat, previous_live)
+            if event is not None:
+                yield event
+        yield "event: end\ndata: {}\n\n"
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/api/live/stream")
+def api_live_stream():
+    """SSE-поток таблицы: одно событие "live" на каждую новую версию данных.
+       Параметры: race, cat (опционально);
+       notify=1 — вместо таблицы событие "version" с номером версии: клиент
+       с виртуальной прокруткой сам запрашивает видимые строки через /api/live."""
+    race = request.args.get("race", "")
+    cat = request.args.get("cat", "")
+    notify = request.args.get("notify") == "1"
+    # EventSource при переподключении присылает id последнего события
+    last_version = live_views.stream_version(request.headers.get("Last-Event-ID", ""),
+                                             live_views.snapshots.current())
+
+    def generate(version):
+        while True:
+            snapshot = live_views.snapshots.wait_newer(version, timeout=STREAM_KEEPALIVE)
+            if snapshot is None or snapshot.version <= version:
+                yield ": keepalive\n\n"
+                continue
+            version = snapshot.version
+            yield live_views.stream_event(snapshot, race, cat, notify)
+
+    return Response(generate(last_version), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route("/health")
 def health():
     return jsonify({"status": "ok"})
 
 if __name__ == "__main__":
-    #  - (     gunicorn + nginx)
+    # Запуск дев-сервером (в продакшн лучше запустить через gunicorn + nginx)
+    # /api/live/stream держит поток на каждого зрителя — для gunicorn нужен
+    # --worker-class gthread с достаточным --threads; при --workers больше 1 — SNAPSHOT_DIR:
+    #   SNAPSHOT_DIR=/run/ski123 gunicorn -w 4 -k gthread --threads 64 -b 0.0.0.0:5000 app:app
+    # Для тысяч зрителей SSE без потока на соединение — асинхронный вариант app_async.py
     app.run(host="0.0.0.0", port=5000, debug=True)
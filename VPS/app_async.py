@@ -0,0 +1,330 @@
+# app_async.py
+"""
+Асинхронный вариант VPS/app.py на aiohttp.web: те же маршруты и сервисы
+(EventService, SnapshotStore, кэш ответов — общие, в services/live_views.py), но зрители SSE не занимают
+по потоку на соединение — тысячи потоков держит один event loop.
+
+    python app_async.py
+    gunicorn app_async:app -k aiohttp.GunicornWebWorker -w 2 -b 0.0.0.0:5000
+
+Несколько воркеров и журнал push — так же, как у app.py, через SNAPSHOT_DIR и JOURNAL_DIR.
+"""
+import asyncio
+import contextvars
+import io
+import json
+import os
+import time
+
+from aiohttp import web
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from services.snapshot import SNAPSHOT_AGE
+from services.response_cache import CachedBody
+from services import json_codec, live_views, metrics, profiling, push_codec
+from services.live_views import SECRET_TOKEN, STREAM_KEEPALIVE, PUSH_MAX_SIZE
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Как долго поток-наблюдатель ждёт новую версию за один заход (сек)
+WATCH_TIMEOUT = 1.0
+
+templates = Environment(loader=FileSystemLoader(os.path.join(BASE_DIR, "templates")),
+                        autoescape=select_autoescape(["html"]))
+
+# Ожидание новой версии для SSE: один asyncio.Event на версию,
+# с приходом следующей он срабатывает и заменяется новым
+_newer = None
+
+
+def _json(obj, status=200):
+    return web.Response(body=json_codec.dumps(obj), status=status, content_type="application/json")
+
+
+class _AcceptEncodings(dict):
+    """Accept-Encoding как request.accept_encodings у Flask: accept["gzip"] — q (0, если не принимается)."""
+
+    def __missing__(self, key):
+        return dict.get(self, "*", 0)
+
+
+def _accept_encodings(header):
+    accept = _AcceptEncodings()
+    for part in header.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0
+        accept[name] = q
+    return accept
+
+
+def _not_modified(request, etag):
+    return any(tag.value in (etag, "*") for tag in request.if_none_match or ())
+
+
+def _conditional(request, etag, make_response):
+    """Ответ с ETag: 304 без тела, если клиент прислал тот же If-None-Match."""
+    if _not_modified(request, etag):
+        resp = web.Response(status=304)
+    else:
+        resp = make_response()
+    resp.etag = etag
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+def _in_executor(func, *args):
+    """
+    func в пуле потоков с контекстом запроса: её этапы metrics.stage попадут в Server-Timing,
+    а ?profile= профилирует обёрнутые profiled() функции внутри неё.
+    """
+    return asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, func, *args)
+
+
+async def _send_cached(request, etag, build):
+    """
+    Ответ с ETag из CachedBody, который возвращает build(): gzip/br, если клиент их принимает.
+    Сборка таблицы, JSON и сжатие — в пуле потоков: на большой гонке это десятки мс,
+    которые иначе стояли бы все остальные запросы event loop. 304 — без сборки.
+    """
+    if _not_modified(request, etag):
+        return _conditional(request, etag, None)
+    accept = _accept_encodings(request.headers.get("Accept-Encoding", ""))
+    encoding, data = await _in_executor(lambda: build().negotiate(accept))
+
+    def make_response():
+        resp = web.Response(body=data, content_type="application/json")
+        if encoding:
+            resp.headers["Content-Encoding"] = encoding
+        resp.headers["Vary"] = "Accept-Encoding"
+        return resp
+    return _conditional(request, etag, make_response)
+
+
+@web.middleware
+async def _metrics_middleware(request, handler):
+    metrics.start_request()
+    if profiling.ENABLED:
+        profiling.start_request(request.query.get("profile", ""))
+    resource = request.match_info.route.resource
+    endpoint = resource.canonical if resource is not None else "other"
+    try:
+        resp = await handler(request)
+    except web.HTTPException as e:
+        e.headers["Server-Timing"] = metrics.finish_request(endpoint, e.status)
+        raise
+    except Exception:
+        metrics.finish_request(endpoint, 500)
+        raise
+    if not resp.prepared:
+        resp.headers["Server-Timing"] = metrics.finish_request(endpoint, resp.status)
+    else:
+        # поток (SSE) уже отправил заголовки
+        metrics.finish_request(endpoint, resp.status)
+    return resp
+
+
+async def index_page(request):
+    return web.Response(text=templates.get_template("index.html").render(), content_type="text/html")
+
+
+async def race_page(request):
+    race_id = request.query.get("race", "")
+    return web.Response(text=templates.get_template("race.html").render(race_id=race_id), content_type="text/html")
+
+
+async def receive_push(request):
+    """То же, что /api/push в app.py; разбор пакета — в пуле потоков, чтобы не стоял event loop."""
+    auth = request.headers.get("Authorization", "")
+    if not auth.startswith("Bearer "):
+        return _json({"error": "unauthorized"}, 401)
+    token = auth.split(" ", 1)[1]
+    if token != SECRET_TOKEN:
+        return _json({"error": "forbidden"}, 403)
+
+    raw = await request.read()
+
+    def decode():
+        with metrics.stage("decode"):
+            body, _ = push_codec.decode_body(io.BytesIO(raw), request.headers.get("Content-Encoding"), PUSH_MAX_SIZE)
+            return json.loads(body)
+
+    try:
+        data = await _in_executor(decode)
+    except push_codec.UnsupportedEncoding:
+        resp = _json({"error": "unsupported encoding"}, 415)
+        resp.headers["Accept-Encoding"] = ", ".join(push_codec.accepted_encodings())
+        return resp
+    except push_codec.PushTooLarge:
+        return _json({"error": "too large"}, 413)
+    except ValueError:
+        data = None
+    # current() может загрузить снимок другого воркера из SNAPSHOT_DIR, publish разбирает пакет —
+    # тоже не на event loop
+    status, result = await _in_executor(live_views.accept_push, data, len(raw))
+    return _json(result, status)
+
+
+async def api_dates(request):
+    snapshot = await _in_executor(live_views.snapshots.current)
+    if snapshot is None:
+        return _json({"error": "no data"}, 404)
+    return _conditional(request, live_views.version_tag(snapshot.version),
+                        lambda: _json({"title": snapshot.title, "dates": snapshot.dates}))
+
+
+async def api_live(request):
+    race = request.query.get("race", "")
+    cat = request.query.get("cat", "")
+    page = live_views.page_args(request.query)
+
+    if "at" in request.query:
+        return await _live_at(request, race, cat, request.query["at"], page)
+
+    snapshot = await _in_executor(live_views.snapshots.current)
+    if snapshot is None:
+        return _json({})
+    SNAPSHOT_AGE.observe(time.time() - snapshot.created_at)
+
+    etag = live_views.live_etag(live_views.version_tag(snapshot.version), race, cat, page)
+    return await _send_cached(request, etag, lambda: live_views.live_body(snapshot, race, cat, page))
+
+
+async def _live_at(request, race, cat, at, page):
+    """Таблица на момент at из истории, как в app.py; восстановление снимка — в пуле потоков."""
+    if live_views.history is None:
+        return _json({"error": "history disabled"}, 404)
+    when = live_views.parse_time(at)
+    if when is None:
+        return _json({"error": "bad at"}, 400)
+    snapshot = await _in_executor(live_views.history.snapshot_at, when)
+    if snapshot is None:
+        return _json({})
+    return await _send_cached(request, live_views.history_etag(snapshot, race, cat, page), lambda: CachedBody(
+        live_views.history_body(snapshot, live_views.history_live(snapshot, race, cat, page))))
+
+
+async def api_live_replay(request):
+    """Повтор гонки из истории SSE-потоком, как /api/live/replay в app.py."""
+    if live_views.history is None:
+        return _json({"error": "history disabled"}, 404)
+    args = live_views.replay_args(request.query)
+    if args is None:
+        return _json({"error": "bad request"}, 400)
+    race, cat, start, end, speed = args
+    timeline = await _in_executor(live_views.replay_timeline, start, end)
+
+    resp = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache",
+                                       "X-Accel-Buffering": "no"})
+    await resp.prepare(request)
+    previous_time = previous_live = None
+    for created_at in timeline:
+        await asyncio.sleep(live_views.replay_pause(previous_time, created_at, speed))
+        previous_time = created_at
+        _snapshot, previous_live, event = await _in_executor(live_views.replay_frame, created_at, race, cat,
+                                                             previous_live)
+        if event is not None:
+            await resp.write(event)
+    await resp.write(b"event: end\ndata: {}\n\n")
+    return resp
+
+
+async def api_live_stream(request):
+    """SSE-поток таблицы, как в app.py (в т.ч. notify=1); ожидание не занимает поток."""
+    race = request.query.get("race", "")
+    cat = request.query.get("cat", "")
+    notify = request.query.get("notify") == "1"
+    current = await _in_executor(live_views.snapshots.current)
+    version = live_views.stream_version(request.headers.get("Last-Event-ID", ""), current)
+
+    resp = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache",
+                                       "X-Accel-Buffering": "no"})
+    await resp.prepare(request)
+    while True:
+        event = _newer
+        # общий файл проверяет поток-наблюдатель (_watch_snapshots) — он и будит этот цикл
+        snapshot = live_views.snapshots.current(sync=False)
+        if snapshot is None or snapshot.version <= version:
+            try:
+                await asyncio.wait_for(event.wait(), STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                await resp.write(b": keepalive\n\n")
+            continue
+        version = snapshot.version
+        if notify:
+            await resp.write(live_views.stream_event(snapshot, race, cat, notify))
+        else:
+            await resp.write(await _in_executor(live_views.stream_event, snapshot, race, cat, notify))
+
+
+async def health(request):
+    return _json({"status": "ok"})
+
+
+async def metrics_page(request):
+    return web.Response(body=metrics.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+def _notify():
+    """Разбудить SSE-потоки: появилась версия новее."""
+    global _newer
+    event, _newer = _newer, asyncio.Event()
+    event.set()
+
+
+async def _watch_snapshots(app):
+    """
+    Один поток на процесс ждёт новую версию в SnapshotStore (push, принятый
+    другим воркером через SNAPSHOT_DIR) и будит SSE-потоки этого процесса.
+    """
+    loop = asyncio.get_running_loop()
+    snapshot = await loop.run_in_executor(None, live_views.snapshots.current)
+    version = snapshot.version if snapshot is not None else 0
+    while True:
+        snapshot = await loop.run_in_executor(None, live_views.snapshots.wait_newer, version, WATCH_TIMEOUT)
+        if snapshot is not None and snapshot.version > version:
+            version = snapshot.version
+            _notify()
+
+
+async def _start_watcher(app):
+    global _newer
+    _newer = asyncio.Event()
+    app["snapshot_watcher"] = asyncio.ensure_future(_watch_snapshots(app))
+
+
+async def _stop_watcher(app):
+    app["snapshot_watcher"].cancel()
+
+
+def create_app():
+    # тело push распаковывает push_codec (с лимитом распакованного размера), а не сервер
+    app = web.Application(client_max_size=PUSH_MAX_SIZE, middlewares=[_metrics_middleware],
+                          handler_args={"auto_decompress": False})
+    app.router.add_get("/", index_page)
+    app.router.add_get("/race", race_page)
+    app.router.add_post("/api/push", receive_push)
+    app.router.add_get("/api/dates", api_dates)
+    app.router.add_get("/api/live", api_live)
+    app.router.add_get("/api/live/stream", api_live_stream)
+    app.router.add_get("/api/live/replay", api_live_replay)
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics_page)
+    app.router.add_static("/static", os.path.join(BASE_DIR, "static"))
+    app.on_startup.append(_start_watcher)
+    app.on_cleanup.append(_stop_watcher)
+    return app
+
+
+app = create_app()
+
+if __name__ == "__main__":
+    web.run_app(app, host="0.0.0.0", port=5000)
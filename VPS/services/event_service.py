@@ -1,6 +1,12 @@
 # services/event_service.py
+import hashlib
+from array import array
 import xml.etree.ElementTree as ET
 from datetime import datetime
+from services import xml_parser, metrics, profiling
+from services.leaderboard import Leaderboard
+from services.result_table import ResultTable, bib_key, order_by_time, gaps_to_leader
+from services.snapshot import Snapshot
 
 NS = {
     's': 'http://schemas.xmlsoap.org/soap/envelope/',
@@ -8,6 +14,10 @@ NS = {
     'a': 'http://schemas.datacontract.org/2004/07/Ski123'
 }
 
+def content_hash(text: str):
+    """sha1 документа — по нему агент и VPS понимают, что документ не изменился."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
 def _time_to_seconds(t: str):
     try:
         if not t or t == "-":
@@ -28,6 +38,24 @@ def _time_to_seconds(t: str):
     except:
         return float("inf")
 
+EMPTY_TABLE = ResultTable((), _time_to_seconds)
+
+def _finish_ranking(race):
+    """Рейтинг колонки финиша — последний (кроме старта) с "ФИНИШ" в названии, как в _build_live."""
+    finish = None
+    for rank in race.get("Rankings", []):
+        if rank["RankingNr"] != "1" and "ФИНИШ" in (rank["ProgressTitle"] or "").upper():
+            finish = rank
+    return finish
+
+def _optional_str(value):
+    return value is None or isinstance(value, str)
+
+def _str_map(value):
+    """None или {строка: строка или None} — results и hashes["results"] пакета."""
+    return value is None or (isinstance(value, dict)
+                             and all(isinstance(k, str) and _optional_str(v) for k, v in value.items()))
+
 class EventService:
     def __init__(self):
         self.NS = NS
@@ -38,65 +66,22 @@ class EventService:
           "event_xml": "<GetEventData SOAP response>",
           "results": { "raceid_1": "<GetResult SOAP response>", ... }
         }
-         dict: title, participants, schedule (unique by RaceId)
+        Возвращает dict: title, participants, schedule (unique by RaceId)
         """
         event_xml = payload.get("event_xml")
         if not event_xml:
             return {}
 
         try:
-            root = ET.fromstring(event_xml)
-        except Exception as e:
+            with metrics.stage("parse"):
+                return xml_parser.parse_event_xml(event_xml) or {}
+        except ET.ParseError as e:
             print("parse_eventdata error:", e)
+            metrics.ERRORS.inc("parse")
             return {}
 
-        result = root.find('.//temp:GetEventDataResult', self.NS)
-        if result is None:
-            return {}
-
-        title = result.findtext('a:MainTitle', default="", namespaces=self.NS)
-
-        participants = {}
-        for p in result.findall('.//a:clsInfoParticipant', self.NS):
-            pid = p.findtext('a:Id', default="", namespaces=self.NS)
-            participants[pid] = {
-                "Name": p.findtext('a:Name', default="", namespaces=self.NS),
-                "Club": p.findtext('a:Club', default="", namespaces=self.NS),
-                "CatId": p.findtext('a:CatId', default="", namespaces=self.NS),
-                "ClassId": p.findtext('a:ClassId', default="", namespaces=self.NS)
-            }
-
-        schedule_dict = {}
-        for s in result.findall('.//a:clsInfoScheduledEvent', self.NS):
-            race_id = s.findtext('a:RaceId', default="", namespaces=self.NS)
-            race_title = s.findtext('a:RaceTitle', default="", namespaces=self.NS)
-            start_dt = s.findtext('a:StartDateTime', default="", namespaces=self.NS) or ""
-            clean_title = race_title.split("-")[0].strip()
-
-            rankings = []
-            for r in s.findall('.//a:clsInfoRankingDefinition', self.NS):
-                rankings.append({
-                    "RankingNr": r.findtext('a:RankingNr', default="", namespaces=self.NS),
-                    "ProgressTitle": r.findtext('a:ProgressTitle', default="", namespaces=self.NS)
-                })
-
-            if race_id not in schedule_dict:
-                schedule_dict[race_id] = {
-                    "RaceId": race_id,
-                    "RaceTitle": clean_title,
-                    "Rankings": rankings,
-                    "StartDateTime": start_dt
-                }
-            else:
-                if not schedule_dict[race_id].get("StartDateTime") and start_dt:
-                    schedule_dict[race_id]["StartDateTime"] = start_dt
-
-        schedule = list(schedule_dict.values())
-
-        return {"title": title, "participants": participants, "schedule": schedule}
-
     def group_dates(self, parsed_event: dict):
-        """ schedule   StartDateTime (YYYY-MM-DD)."""
+        """Группирует schedule по дате StartDateTime (YYYY-MM-DD)."""
         schedule = parsed_event.get("schedule", [])
         groups = {}
         for s in schedule:
@@ -107,19 +92,173 @@ class EventService:
                 "RaceTitle": s["RaceTitle"],
                 "StartDateTime": s.get("StartDateTime", "")
             })
-        dates = sorted([d for d in groups.keys() if d != " "])
-        if " " in groups:
-            dates.append(" ")
+        dates = sorted([d for d in groups.keys() if d != "Без даты"])
+        if "Без даты" in groups:
+            dates.append("Без даты")
         out = []
         for d in dates:
             races = sorted(groups[d], key=lambda x: x.get("StartDateTime") or "")
             out.append({"date": d, "races": races})
         return out
 
+    def parse_result_rows(self, xml: str):
+        """
+        Разбирает raw xml ответа GetResult в кортеж строк (Bib, Id, Result, Behind).
+        Отсутствующие поля Result/Behind остаются None — значения по умолчанию
+        подставляются при построении таблицы.
+        """
+        if not xml:
+            return ()
+        try:
+            with metrics.stage("parse"):
+                return xml_parser.parse_result_rows(xml) or ()
+        except ET.ParseError as e:
+            print("parse result xml:", e)
+            metrics.ERRORS.inc("parse")
+            return ()
+
+    def parse_result_table(self, xml: str):
+        """Ответ GetResult в колонках ResultTable: время каждой строки разбирается здесь один раз."""
+        rows = self.parse_result_rows(xml)
+        return ResultTable(rows, _time_to_seconds) if rows else EMPTY_TABLE
+
+    def valid_push(self, payload) -> bool:
+        """
+        Пакет нужного вида: event_xml — строка, results — {ключ: xml},
+        hashes — {"event_xml": h, "results": {ключ: h}}; любое поле может отсутствовать,
+        тело или хеш документа — быть null.
+        """
+        if not isinstance(payload, dict):
+            return False
+        if not _optional_str(payload.get("event_xml")) or not _str_map(payload.get("results")):
+            return False
+        hashes = payload.get("hashes")
+        if hashes is None:
+            return True
+        return (isinstance(hashes, dict) and _optional_str(hashes.get("event_xml"))
+                and _str_map(hashes.get("results")))
+
+    def push_hashes(self, payload: dict):
+        """
+        Хеши документов пакета: {"event_xml": h, "results": {"raceid_rank": h}}.
+        Дельта-пакет присылает их сам; для полного пакета старого формата считаем здесь.
+        """
+        hashes = payload.get("hashes")
+        if hashes is not None:
+            return {"event_xml": hashes.get("event_xml") or "", "results": dict(hashes.get("results") or {})}
+        event_xml = payload.get("event_xml")
+        return {
+            "event_xml": content_hash(event_xml) if event_xml else "",
+            "results": {k: content_hash(x) for k, x in (payload.get("results") or {}).items() if x}
+        }
+
+    def missing_documents(self, base, payload: dict):
+        """
+        Документы, которые дельта-пакет не прислал, а на VPS их нет
+        (или есть другая версия). Непустой список — нужна полная пересылка.
+        """
+        hashes = self.push_hashes(payload)
+        base_hashes = base.hashes if base is not None else {"event_xml": "", "results": {}}
+        # у дельты документ без тела и без хеша — тоже пропущен: взять его не из чего
+        delta = payload.get("hashes") is not None
+        missing = []
+        h = hashes["event_xml"]
+        if payload.get("event_xml") is None and (h or delta) and (not h or base_hashes["event_xml"] != h):
+            missing.append("event_xml")
+        bodies = payload.get("results") or {}
+        for key, h in hashes["results"].items():
+            if key not in bodies and (not h or base_hashes["results"].get(key) != h):
+                missing.append(key)
+        return missing
+
+    def build_snapshot(self, payload: dict, version: int, base: Snapshot = None):
+        """
+        Разбирает payload один раз в неизменяемый Snapshot:
+        участники, расписание, сгруппированные даты и протоколы всех GetResult (ResultTable).
+        Документы без тела (дельта-пакет) берутся уже разобранными из base.
+        """
+        hashes = self.push_hashes(payload)
+
+        if payload.get("event_xml") is None and base is not None and hashes["event_xml"]:
+            title, participants, schedule, dates = base.title, base.participants, base.schedule, base.dates
+        else:
+            parsed = self.parse_eventdata_from_payload(payload)
+            title = parsed.get("title", "")
+            participants = parsed.get("participants", {})
+            schedule = parsed.get("schedule", [])
+            dates = self.group_dates(parsed)
+
+        bodies = payload.get("results") or {}
+        results = {}
+        for key in hashes["results"]:
+            if key in bodies:
+                results[key] = self.parse_result_table(bodies[key])
+            else:
+                results[key] = base.results.get(key, EMPTY_TABLE) if base is not None else EMPTY_TABLE
+
+        # таблицы мест: пересчитываются только гонки, у которых пришёл новый протокол финиша
+        boards = {}
+        base_boards = base.boards if base is not None else {}
+        same_event = base is not None and participants is base.participants
+        for race in schedule:
+            finish = _finish_ranking(race)
+            if finish is None:
+                continue
+            race_id = race["RaceId"]
+            key = f"{race_id}_{finish['RankingNr']}"
+            board = base_boards.get(race_id)
+            if board is None or not same_event or key in bodies:
+                board = (board or Leaderboard()).updated(self._finishers(results.get(key, EMPTY_TABLE), participants))
+            boards[race_id] = board
+
+        return Snapshot(
+            version=version,
+            title=title,
+            participants=participants,
+            schedule=schedule,
+            dates=dates,
+            results=results,
+            hashes=hashes,
+            boards=boards
+        )
+
+    def _finishers(self, results, participants):
+        """{bib: (секунды, CatId, строка времени)} по протоколу финиша (ResultTable)."""
+        finishers = {}
+        for bib, athlete_id, value, seconds in zip(results.bibs, results.ids, results.values, results.seconds):
+            # как в таблице: побеждает последняя строка номера, "-" и пустое — не финишировал
+            if value and value != "-":
+                finishers[bib] = (seconds, participants.get(athlete_id, {}).get("CatId", ""), value)
+            else:
+                finishers.pop(bib, None)
+        return finishers
+
+    @profiling.profiled("build_live_from_snapshot")
+    def build_live_from_snapshot(self, snapshot: Snapshot, race_id: str = "", cat_filter: str = ""):
+        """Таблица гонки по готовому Snapshot — без разбора XML."""
+        parsed_event = {
+            "title": snapshot.title,
+            "participants": snapshot.participants,
+            "schedule": snapshot.schedule
+        }
+        with metrics.stage("table"):
+            return self._build_live(parsed_event, snapshot.results.get, race_id, cat_filter, boards=snapshot.boards)
+
+    @profiling.profiled("build_live_from_payload")
     def build_live_from_payload(self, parsed_event: dict, payload: dict, race_id: str = "", cat_filter: str = ""):
         """
-           parsed_event (title/participants/schedule)
-         payload['results']   raw xml  GetResult.
+        Формирует таблицу используя parsed_event (title/participants/schedule)
+        и payload['results'] — словарь raw xml ответов GetResult.
+        """
+        results = payload.get("results", {})
+        return self._build_live(parsed_event, lambda key: self.parse_result_table(results.get(key)),
+                                race_id, cat_filter)
+
+    def _build_live(self, parsed_event: dict, get_rows, race_id: str = "", cat_filter: str = "", boards=None):
+        """
+        Общая сборка таблицы. get_rows(key) возвращает ResultTable
+        GetResult для ключа "raceid_rank" (или None, если данных нет).
+        boards — {RaceId: Leaderboard}: порядок финишировавших берётся готовым, без сортировки.
         """
         title = parsed_event.get("title", "")
         participants = parsed_event.get("participants", {})
@@ -127,64 +266,41 @@ class EventService:
         if not schedule:
             return {}
 
-        #  
-        race = schedule[0] if not race_id else next((r for r in schedule if r["RaceId"] == race_id), schedule[0])
+        # выберем гонку
+        race = self.resolve_race(schedule, race_id)
         race_id = race["RaceId"]
 
         table = {}
         headers = []
         finish_column = None
+        finish_seconds = {}  # bib -> секунды финиша из колонки ResultTable.seconds
 
-        #  (RankingNr = 1)   results: f"{race_id}_1"
-        start_key = f"{race_id}_1"
-        start_xml = payload.get("results", {}).get(start_key)
-        if start_xml:
-            try:
-                root2 = ET.fromstring(start_xml)
-                result2 = root2.find('.//temp:GetResultResult', self.NS)
-                if result2 is not None:
-                    for r in result2.findall('.//a:clsInfoResultRow', self.NS):
-                        bib = r.findtext('a:Bib', default="-", namespaces=self.NS)
-                        athlete_id = r.findtext('a:Id', default="", namespaces=self.NS)
-                        start_time = r.findtext('a:Result', default="", namespaces=self.NS)
-                        pinfo = participants.get(athlete_id, {})
-                        table[bib] = {
-                            "Bib": bib,
-                            "Name": pinfo.get("Name", athlete_id),
-                            "Club": pinfo.get("Club", ""),
-                            "CatId": pinfo.get("CatId", ""),
-                            "Start": start_time
-                        }
-            except Exception as e:
-                print("parse start_xml error:", e)
+        # старт (RankingNr = 1) — ключ results: f"{race_id}_1"
+        for bib, athlete_id, start_time in get_rows(f"{race_id}_1") or ():
+            pinfo = participants.get(athlete_id, {})
+            table[bib] = {
+                "Bib": bib,
+                "Name": pinfo.get("Name", athlete_id),
+                "Club": pinfo.get("Club", ""),
+                "CatId": pinfo.get("CatId", ""),
+                "Start": start_time if start_time is not None else ""
+            }
         headers.append("Start")
 
-        #       race['Rankings']
+        # остальные рейтинги — берём из race['Rankings']
         for rank in race.get("Rankings", []):
             if rank["RankingNr"] == "1":
                 continue
             ranking_nr = rank["RankingNr"]
             title_rank = rank["ProgressTitle"]
-            key = f"{race_id}_{ranking_nr}"
-            xml = payload.get("results", {}).get(key)
             headers.append(title_rank)
-            if "" in (title_rank or "").upper():
+            is_finish = "ФИНИШ" in (title_rank or "").upper()
+            if is_finish:
                 finish_column = title_rank
-            if not xml:
-                continue
-            try:
-                root3 = ET.fromstring(xml)
-                result3 = root3.find('.//temp:GetResultResult', self.NS)
-            except Exception as e:
-                print("parse result xml:", e)
-                result3 = None
-            if not result3:
-                continue
-            for r in result3.findall('.//a:clsInfoResultRow', self.NS):
-                bib = r.findtext('a:Bib', default="-", namespaces=self.NS)
-                value = r.findtext('a:Result', default="-", namespaces=self.NS)
-                behind = r.findtext('a:Behind', default="", namespaces=self.NS)
-                athlete_id = r.findtext('a:Id', default="", namespaces=self.NS)
+            results = get_rows(f"{race_id}_{ranking_nr}") or EMPTY_TABLE
+            if is_finish:
+                finish_seconds = dict(zip(results.bibs, results.seconds))
+            for bib, athlete_id, value in results:
                 if bib not in table:
                     pinfo = participants.get(athlete_id, {})
                     table[bib] = {
@@ -194,62 +310,65 @@ class EventService:
                         "CatId": pinfo.get("CatId", ""),
                         "Start": ""
                     }
-                table[bib][title_rank] = value
-                if "" in (title_rank or "").upper():
-                    table[bib]["_raw"] = behind
+                table[bib][title_rank] = value if value is not None else "-"
 
         rows_all = list(table.values())
-        # 
+        # категории
         categories = sorted(set(r.get("CatId", "") for r in rows_all if r.get("CatId")))
         rows = [r for r in rows_all if not cat_filter or r.get("CatId") == cat_filter]
 
-        #    (   ,  )
+        # сортировка и отставание (по финишу внутри категории, если выбран)
         if finish_column:
-            finished = [r for r in rows if r.get(finish_column) and r.get(finish_column) != "-"]
             not_finished = [r for r in rows if not r.get(finish_column) or r.get(finish_column) == "-"]
-
-            finished.sort(key=lambda x: _time_to_seconds(x.get(finish_column)))
+            board = boards.get(race_id) if boards else None
+            finished, times = None, None
+            if board is not None:
+                finished, times = self._standings_rows(board, table, finish_column, cat_filter,
+                                                       len(rows) - len(not_finished))
+            if finished is None:
+                # равное время — по номеру, как в Leaderboard
+                finished = sorted((r for r in rows if r.get(finish_column) and r.get(finish_column) != "-"),
+                                  key=lambda r: bib_key(r["Bib"]))
+                seconds = array("d", [finish_seconds[r["Bib"]] for r in finished])
+                order = order_by_time(seconds)
+                finished = [finished[i] for i in order]
+                times = [seconds[i] for i in order]
             not_finished.sort(key=lambda x: int(x.get("Bib", 9999)))
 
             leader_time = None
             if finished:
-                leader_time = _time_to_seconds(finished[0].get(finish_column))
+                leader_time = times[0]
+                times = gaps_to_leader(times, leader_time)
 
             place = 1
-            for r in finished:
-                r[""] = place
+            for r, diff in zip(finished, times):
+                r["Место"] = place
                 place += 1
                 if leader_time is not None:
-                    cur = _time_to_seconds(r.get(finish_column))
-                    diff = cur - leader_time
                     if diff <= 0.0001:
-                        r[""] = ""
+                        r["Отставание"] = ""
                     else:
                         minutes = int(diff // 60)
                         seconds = diff - minutes * 60
-                        r[""] = f"+{minutes}:{seconds:05.2f}"
+                        r["Отставание"] = f"+{minutes}:{seconds:05.2f}"
                 else:
-                    r[""] = ""
-                if "_raw" in r:
-                    del r["_raw"]
+                    r["Отставание"] = ""
 
             for r in not_finished:
-                r[""] = ""
-                r[""] = ""
-                if "_raw" in r:
-                    del r["_raw"]
+                r["Место"] = ""
+                r["Отставание"] = ""
 
             rows = finished + not_finished
         else:
             rows.sort(key=lambda x: int(x.get("Bib", 9999)))
             for r in rows:
-                r[""] = ""
-                r[""] = ""
+                r["Место"] = ""
+                r["Отставание"] = ""
 
-        if "" not in headers:
-            headers.append("")
-        if "" not in headers:
-            headers.append("")
+        if "Отставание" not in headers:
+            headers.append("Отставание")
+        if "Место" not in headers:
+            headers.append("Место")
 
         return {
             "title": title,
@@ -262,9 +381,71 @@ class EventService:
             "selected_cat": cat_filter
         }
 
+    def resolve_race(self, schedule: list, race_id: str = ""):
+        """Гонка расписания с RaceId race_id; пустой или неизвестный — первая. None — расписание пусто."""
+        if not schedule:
+            return None
+        if not race_id:
+            return schedule[0]
+        return next((r for r in schedule if r["RaceId"] == race_id), schedule[0])
+
+    def slice_live(self, live: dict, offset: int = 0, limit: int = None, around: str = "", columnar: bool = False):
+        """
+        Часть готовой таблицы build_live_*: строки [offset, offset + limit), live не меняется.
+        around — номер участника: окно сдвигается так, чтобы он оказался в середине.
+        columnar — строки колонками: "columns" (имена полей) и "values" (массив значений на колонку).
+        В ответ добавляются total (строк всего) и offset (фактическое начало окна).
+        """
+        if not live:
+            return live
+        rows = live["rows"]
+        total = len(rows)
+        offset = self.page_offset(live, offset, limit, around)
+        end = total if limit is None else min(total, offset + max(limit, 0))
+        page = rows[offset:end]
+
+        out = {k: v for k, v in live.items() if k != "rows"}
+        out["total"] = total
+        out["offset"] = offset
+        if columnar:
+            columns = ["Bib", "Name", "Club", "CatId"]
+            columns += [h for h in live["headers"] if h not in columns]
+            out["columns"] = columns
+            out["values"] = [[r.get(c, "") for r in page] for c in columns]
+        else:
+            out["rows"] = page
+        return out
+
+    def page_offset(self, live: dict, offset: int = 0, limit: int = None, around: str = ""):
+        """Фактическое начало окна slice_live: с учётом around и в пределах таблицы."""
+        rows = live.get("rows", ()) if live else ()
+        if around and limit:
+            index = next((i for i, r in enumerate(rows) if r.get("Bib") == around), None)
+            if index is not None:
+                offset = index - limit // 2
+        return max(0, min(offset, len(rows)))
+
+    def _standings_rows(self, board, table, finish_column, cat_filter, expected):
+        """
+        Строки финишировавших и их время в порядке Leaderboard.
+        (None, None), если доска не совпадает с собранной таблицей — тогда сортируем как раньше.
+        """
+        standings = board.standings(cat_filter)
+        if len(standings) != expected:
+            return None, None
+        finished = []
+        times = []
+        for seconds, bib, value in standings:
+            r = table.get(bib)
+            if r is None or r.get(finish_column) != value or (cat_filter and r.get("CatId") != cat_filter):
+                return None, None
+            finished.append(r)
+            times.append(seconds)
+        return finished, times
+
     def _parse_date_only(self, dt_str):
         if not dt_str:
-            return " "
+            return "Без даты"
         try:
             if "T" in dt_str:
                 d = datetime.fromisoformat(dt_str.split(".")[0])
@@ -280,4 +461,4 @@ class EventService:
                     return maybe
                 except:
                     pass
-            return " "
+            return "Без даты"
@@ -0,0 +1,69 @@
+# services/leaderboard.py
+from bisect import bisect_left, insort
+
+from services.result_table import bib_key
+
+
+class Leaderboard:
+    """
+    Финишировавшие одной гонки в порядке времени финиша:
+    общий список и отдельный список для каждой CatId.
+    После создания не меняется — updated() возвращает новый объект,
+    в котором переставлены только изменившиеся номера (bisect по отсортированному списку),
+    а списки незатронутых категорий разделяются со старым.
+    """
+    __slots__ = ("_entries", "_all", "_by_cat")
+
+    def __init__(self):
+        self._entries = {}   # bib -> (seconds, cat, value)
+        self._all = []       # [(seconds, bib_key, bib)] по возрастанию
+        self._by_cat = {}    # cat -> [(seconds, bib_key, bib)]
+
+    def __len__(self):
+        return len(self._all)
+
+    def updated(self, finishers):
+        """
+        finishers: {bib: (seconds, cat, value)} — текущий протокол финиша целиком.
+        Возвращает self, если ничего не изменилось.
+        """
+        entries = self._entries
+        changed = [bib for bib, entry in finishers.items() if entries.get(bib) != entry]
+        removed = [bib for bib in entries if bib not in finishers]
+        if not changed and not removed:
+            return self
+
+        board = Leaderboard()
+        board._entries = finishers
+        board._all = list(self._all)
+        board._by_cat = dict(self._by_cat)
+        copied = set()
+
+        def cat_list(cat):
+            if cat not in copied:
+                board._by_cat[cat] = list(board._by_cat.get(cat, ()))
+                copied.add(cat)
+            return board._by_cat[cat]
+
+        for bib in removed + changed:
+            old = entries.get(bib)
+            if old is not None:
+                item = (old[0], bib_key(bib), bib)
+                del board._all[bisect_left(board._all, item)]
+                lst = cat_list(old[1])
+                del lst[bisect_left(lst, item)]
+        for bib in changed:
+            seconds, cat, _ = finishers[bib]
+            item = (seconds, bib_key(bib), bib)
+            insort(board._all, item)
+            insort(cat_list(cat), item)
+        for cat in copied:
+            if not board._by_cat[cat]:
+                del board._by_cat[cat]
+        return board
+
+    def standings(self, cat=""):
+        """[(seconds, bib, value)] в порядке мест — по всей гонке или внутри категории."""
+        items = self._by_cat.get(cat, ()) if cat else self._all
+        entries = self._entries
+        return [(seconds, bib, entries[bib][2]) for seconds, _, bib in items]
@@ -0,0 +1,255 @@
+# services/live_views.py
+"""
+Общее для app.py (Flask) и app_async.py (aiohttp): настройки из окружения,
+хранилище снимков с журналом и историей, кэши таблиц и сборка ответов /api/push,
+/api/live, /api/live/replay и /api/live/stream. В приложениях — только разбор запроса
+и ответ своего фреймворка.
+"""
+import os
+import zlib
+from datetime import datetime
+
+from services.event_service import EventService
+from services.snapshot import SnapshotStore, PUSH_BYTES
+from services.shared_snapshot import SharedSnapshot
+from services.push_journal import PushJournal
+from services.push_history import PushHistory
+from services.response_cache import ResponseCache, CachedBody
+from services import json_codec, metrics
+
+# Секретный токен: установи в окружении на VPS или в docker run: -e SECRET_TOKEN=твой_токен
+SECRET_TOKEN = os.environ.get("SECRET_TOKEN", "changeme_replace")
+
+# Хранилище последнего пришедшего пакета от агента: разбирается один раз при push,
+# GET-запросы работают только с готовым Snapshot.
+# При нескольких воркерах задай SNAPSHOT_DIR (например /run/ski123) — push,
+# пришедший в любой воркер, через общий файл сразу увидят все остальные
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", "")
+# JOURNAL_DIR (постоянный каталог, например /var/lib/ski123) — журнал принятых push:
+# после перезапуска данные восстанавливаются из него сразу, не дожидаясь агента
+JOURNAL_DIR = os.environ.get("JOURNAL_DIR", "")
+journal = PushJournal(JOURNAL_DIR) if JOURNAL_DIR else None
+# HISTORY_DIR — история всех push по дням: /api/live?at=<время> и /api/live/replay;
+# HISTORY_MAX_BYTES — сколько она может занять на диске (по умолчанию 1 ГБ), старые дни удаляются
+HISTORY_DIR = os.environ.get("HISTORY_DIR", "")
+HISTORY_MAX_BYTES = int(os.environ.get("HISTORY_MAX_BYTES", 1024 * 1024 * 1024))
+
+event_svc = EventService()
+history = PushHistory(HISTORY_DIR, event_svc.build_snapshot, max_bytes=HISTORY_MAX_BYTES) if HISTORY_DIR else None
+snapshots = SnapshotStore(shared=SharedSnapshot(SNAPSHOT_DIR) if SNAPSHOT_DIR else None, journal=journal,
+                          history=history)
+if journal is not None:
+    snapshots.restore(journal.replay(event_svc.build_snapshot))
+
+# Интервал keep-alive комментариев в SSE-потоке (сек): держит соединение через прокси
+STREAM_KEEPALIVE = 15
+
+# Таблицы, уже собранные для текущей версии: все зрители одной гонки/категории
+# (и /api/live, и SSE) получают одни и те же готовые байты, в т.ч. сжатые —
+# сериализация и сжатие выполняются один раз на push, а не на каждого зрителя
+# Ключ кэша — гонка и категория, как их понял build_live (неизвестная гонка — первая,
+# неизвестная категория — все), поэтому мусорные ?race= не плодят копии одной таблицы
+LIVE_CACHE_SIZE = 256
+# Сумма несжатых тел в live_cache: таблица большой гонки — мегабайты
+LIVE_CACHE_BYTES = 64 * 1024 * 1024
+live_cache = ResponseCache(LIVE_CACHE_SIZE, LIVE_CACHE_BYTES, size=lambda body: len(body.plain))
+# Собранные таблицы целиком — из них режутся страницы (offset/limit/around)
+live_tables = ResponseCache(LIVE_CACHE_SIZE)
+
+# Наибольший размер пакета агента после распаковки: полные протоколы большой гонки — несколько МБ
+PUSH_MAX_SIZE = 64 * 1024 * 1024
+
+# Наибольший limit одной страницы /api/live
+LIVE_PAGE_MAX = 1000
+
+# Повтор гонки: наибольшая пауза между событиями (сек) — перерывы между гонками не ждём целиком
+REPLAY_MAX_PAUSE = 5
+
+
+def accept_push(data, wire_size):
+    """
+    Разобранный JSON пакета агента -> (HTTP-статус, JSON ответа).
+    Дельта-пакет: {"hashes": {...}, "event_xml"/"results" — только изменившиеся документы}.
+    """
+    if not data or not event_svc.valid_push(data):
+        return 400, {"error": "bad request"}
+    PUSH_BYTES.observe(wire_size)
+
+    base = snapshots.current()
+    missing = event_svc.missing_documents(base, data)
+    if missing:
+        # у VPS нет базовой версии этих документов — агент должен прислать всё целиком
+        return 409, {"error": "resync", "missing": missing}
+
+    if base is not None and base.hashes == event_svc.push_hashes(data):
+        return 200, {"status": "ok", "version": base.version, "changed": False}
+
+    snapshot = snapshots.publish(lambda version, latest: event_svc.build_snapshot(data, version, base=latest),
+                                 record=data)
+    return 200, {"status": "ok", "version": snapshot.version, "changed": True}
+
+
+def version_tag(version):
+    # без JOURNAL_DIR версии после перезапуска начинаются заново — с эпохой запуска
+    # старый ETag или id SSE не совпадёт с новым
+    return f"{snapshots.epoch}.{version}"
+
+
+def stream_version(last_event_id, current):
+    """
+    Версия, после которой SSE-поток продолжает отдавать события: из Last-Event-ID
+    переподключившегося EventSource ("<эпоха>.<версия>"), 0 — с текущей.
+    """
+    epoch, _, last_id = last_event_id.rpartition(".")
+    try:
+        version = int(last_id) if epoch == snapshots.epoch else 0
+    except ValueError:
+        version = 0
+    if current is None or version > current.version:
+        version = 0
+    return version
+
+
+def stream_event(snapshot, race, cat, notify):
+    """
+    Событие SSE-потока о версии snapshot: таблица (race, cat) или, с notify, только номер
+    версии — клиент с виртуальной прокруткой сам запрашивает видимые строки через /api/live.
+    """
+    event_id = version_tag(snapshot.version).encode("ascii")
+    if notify:
+        return b"id: %s\nevent: version\ndata: %d\n\n" % (event_id, snapshot.version)
+    return b"id: %s\nevent: live\ndata: %s\n\n" % (event_id, live_body(snapshot, race, cat).plain)
+
+
+def live_etag(version, race, cat, page=None):
+    # race/cat могут быть не-ASCII — в заголовок кладём их crc32
+    key = zlib.crc32("\x00".join(map(str, (race, cat) + (page or ()))).encode("utf-8"))
+    return f"{version}-{key:08x}"
+
+
+def _int_arg(query, name, default):
+    try:
+        return int(query.get(name, default))
+    except ValueError:
+        return default
+
+
+def page_args(query):
+    """(offset, limit, around, columnar) из параметров запроса или None — таблица целиком."""
+    if not any(name in query for name in ("offset", "limit", "around", "format")):
+        return None
+    offset = max(_int_arg(query, "offset", 0), 0)
+    limit = min(max(_int_arg(query, "limit", LIVE_PAGE_MAX), 0), LIVE_PAGE_MAX)
+    return offset, limit, query.get("around", ""), query.get("format") == "columns"
+
+
+def live_table(snapshot, race, cat):
+    return live_tables.get(snapshot.version, (race, cat),
+                           lambda: event_svc.build_live_from_snapshot(snapshot, race_id=race, cat_filter=cat))
+
+
+def live_key(snapshot, race, cat):
+    """(RaceId, CatId) таблицы, которую build_live отдаст на race/cat из запроса."""
+    selected = event_svc.resolve_race(snapshot.schedule, race)
+    if selected is None:
+        return "", ""
+    race = selected["RaceId"]
+    if cat and cat not in live_table(snapshot, race, "").get("categories", ()):
+        cat = ""
+    return race, cat
+
+
+def live_body(snapshot, race, cat, page=None):
+    """CachedBody таблицы (race, cat) — целиком или страницы page — для версии snapshot."""
+    race, cat = live_key(snapshot, race, cat)
+    if page is not None:
+        # around и offset за концом таблицы — в фактическое начало окна:
+        # поиск разных номеров не заводит по записи кэша на каждый
+        offset, limit, around, columnar = page
+        page = event_svc.page_offset(live_table(snapshot, race, cat), offset, limit, around), limit, columnar
+
+    def build():
+        live = live_table(snapshot, race, cat)
+        if page is not None:
+            offset, limit, columnar = page
+            live = event_svc.slice_live(live, offset, limit, columnar=columnar)
+            if live:
+                # клиент по версии понимает, что закэшированные у него страницы устарели,
+                # по эпохе — что сервер перезапускался и версии начались заново
+                live["version"] = snapshot.version
+                live["epoch"] = snapshots.epoch
+        with metrics.stage("json"):
+            return CachedBody(json_codec.dumps(live))
+    return live_cache.get(snapshot.version, (race, cat, page), build)
+
+
+def parse_time(value):
+    """unix-время (число) или ISO 8601 (без смещения — время сервера) -> unix-время; None — не разобрать."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+def history_live(snapshot, race, cat, page=None):
+    """Таблица (race, cat) по снимку из истории."""
+    live = event_svc.build_live_from_snapshot(snapshot, race_id=race, cat_filter=cat)
+    if page is not None:
+        live = event_svc.slice_live(live, *page)
+    return live
+
+
+def history_body(snapshot, live):
+    """JSON таблицы из истории — с версией и временем снимка."""
+    if live:
+        live = dict(live, version=snapshot.version, at=snapshot.created_at)
+    with metrics.stage("json"):
+        return json_codec.dumps(live)
+
+
+def history_etag(snapshot, race, cat, page=None):
+    # без JOURNAL_DIR версии после перезапуска повторяются — в ETag и время снимка
+    return live_etag(f"h{snapshot.version}.{snapshot.created_at:.3f}", race, cat, page)
+
+
+def replay_args(query):
+    """(race, cat, from, to, speed) повтора гонки из параметров запроса или None — неверные параметры."""
+    start = parse_time(query["from"]) if "from" in query else None
+    end = parse_time(query["to"]) if "to" in query else None
+    try:
+        speed = float(query.get("speed", 10))
+    except ValueError:
+        speed = 0
+    if ("from" in query and start is None) or ("to" in query and end is None) or not speed > 0:
+        return None
+    return query.get("race", ""), query.get("cat", ""), start, end, speed
+
+
+def replay_timeline(start, end):
+    """Моменты повтора: таблица на момент start, затем каждая запись истории после него."""
+    timeline = [created_at for created_at, _version in history.timeline(start, end)]
+    if start is not None:
+        timeline.insert(0, start)
+    return timeline
+
+
+def replay_pause(previous_time, created_at, speed):
+    """Пауза перед событием повтора (сек)."""
+    if previous_time is None:
+        return 0
+    return min((created_at - previous_time) / speed, REPLAY_MAX_PAUSE)
+
+
+def replay_frame(when, race, cat, previous_live):
+    """(снимок, таблица, событие SSE — только если таблица изменилась) на момент when."""
+    snapshot = history.snapshot_at(when)
+    if snapshot is None:
+        return None, previous_live, None
+    live = history_live(snapshot, race, cat)
+    if live == previous_live:
+        return snapshot, live, None
+    return snapshot, live, b"id: %d\nevent: live\ndata: %s\n\n" % (snapshot.version, history_body(snapshot, live))
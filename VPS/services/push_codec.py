@@ -0,0 +1,109 @@
+# services/push_codec.py
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # необязательная зависимость — без неё принимаем gzip и несжатые пакеты
+    zstandard = None
+
+# Сколько сжатых байт читать за раз
+CHUNK_SIZE = 64 * 1024
+
+
+class PushTooLarge(Exception):
+    """Пакет (после распаковки) больше допустимого."""
+
+
+class UnsupportedEncoding(Exception):
+    """Content-Encoding, который VPS не умеет распаковывать."""
+
+
+def accepted_encodings():
+    """Content-Encoding тела push, которые можно прислать."""
+    return ("zstd", "gzip", "identity") if zstandard is not None else ("gzip", "identity")
+
+
+def decode_body(source, encoding, max_size):
+    """
+    Тело push из source (файл: read(n)) по Content-Encoding — потоково, кусками CHUNK_SIZE:
+    распакованный пакет больше max_size не собирается целиком в памяти (zip-бомба),
+    а сразу даёт PushTooLarge. Повреждённый поток — ValueError.
+    Возвращает (тело, сколько байт пришло по сети).
+    """
+    encoding = (encoding or "identity").strip().lower()
+    if encoding == "identity":
+        return _read_plain(source, max_size)
+    if encoding in ("gzip", "x-gzip"):
+        return _decode_gzip(source, max_size)
+    if encoding == "zstd" and zstandard is not None:
+        return _decode_zstd(source, max_size)
+    raise UnsupportedEncoding(encoding)
+
+
+def _read_plain(source, max_size):
+    # не read(max_size + 1): поток werkzeug выделил бы буфер на весь лимит сразу
+    parts = []
+    size = 0
+    while True:
+        chunk = source.read(min(CHUNK_SIZE, max_size - size + 1))
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_size:
+            raise PushTooLarge()
+        parts.append(chunk)
+    return b"".join(parts), size
+
+
+def _decode_gzip(source, max_size):
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    parts = []
+    size = wire = 0
+    try:
+        while not decompressor.eof:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                raise ValueError("gzip: поток оборвался")
+            wire += len(chunk)
+            # не больше, чем осталось до лимита (+1 — чтобы заметить превышение);
+            # пока лимит не достигнут, кусок распаковывается целиком
+            part = decompressor.decompress(chunk, max_size - size + 1)
+            size += len(part)
+            if size > max_size:
+                raise PushTooLarge()
+            parts.append(part)
+    except zlib.error as e:
+        raise ValueError(f"gzip: {e}") from e
+    return b"".join(parts), wire
+
+
+class _CountingReader:
+    """source с подсчётом прочитанных байт."""
+
+    def __init__(self, source):
+        self.source = source
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        self.count += len(data)
+        return data
+
+
+def _decode_zstd(source, max_size):
+    counting = _CountingReader(source)
+    parts = []
+    size = 0
+    try:
+        with zstandard.ZstdDecompressor().stream_reader(counting, read_size=CHUNK_SIZE) as reader:
+            while True:
+                part = reader.read(CHUNK_SIZE)
+                if not part:
+                    break
+                size += len(part)
+                if size > max_size:
+                    raise PushTooLarge()
+                parts.append(part)
+    except zstandard.ZstdError as e:
+        raise ValueError(f"zstd: {e}") from e
+    return b"".join(parts), counting.count
@@ -0,0 +1,240 @@
+# services/push_history.py
+import json
+import mmap
+import os
+import pickle
+import re
+import shutil
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from services import json_codec
+
+# Полный снимок (опорный кадр) — каждые KEYFRAME_EVERY версий: восстановление любой
+# версии — загрузка кадра и не больше KEYFRAME_EVERY - 1 пакетов (обычно дельт) поверх
+KEYFRAME_EVERY = 20
+# Сколько восстановленных Snapshot держать в памяти
+SNAPSHOT_CACHE_SIZE = 4
+# Новый сегмент — с началом суток (время сервера) или когда пакеты сегмента переросли SEGMENT_MAX_BYTES
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+# Сколько места по умолчанию может занять вся история: старые сегменты удаляются целиком
+HISTORY_MAX_BYTES = 1024 * 1024 * 1024
+# zlib для пакетов и опорных кадров: JSON с XML протоколов сжимается примерно в 10 раз
+COMPRESS_LEVEL = 3
+
+# Запись индекса: время публикации, версия, смещение пакета в history.log, опорный кадр (0/1)
+_ENTRY = struct.Struct("<dQQB")
+# Заголовок пакета в history.log: длина сжатого JSON
+_RECORD = struct.Struct("<I")
+_SEGMENT_NAME = re.compile(r"\d{8}-\d{4}")
+
+
+class PushHistory:
+    """
+    История всех принятых push — для просмотра таблицы на заданный момент и повтора гонки.
+    Хранится сегментами: каталог directory/ГГГГММДД-NNNN на сутки (и следующий, если
+    сутки переросли SEGMENT_MAX_BYTES), в каждом:
+      history.log        — пакеты, как пришли (в т.ч. дельты): длина + JSON, сжатый zlib
+      history.idx        — записи фиксированной длины по возрастанию времени:
+                           поиск момента — двоичный поиск прямо по файлу, без загрузки в память
+      keyframes/N.pickle.z — полный Snapshot (pickle, zlib) для опорного кадра — N-й записи индекса
+                           (версии без JOURNAL_DIR после перезапуска начинаются заново)
+    Первая запись сегмента — всегда опорный кадр, поэтому сегменты независимы: когда
+    история больше max_bytes, самые старые сегменты удаляются целиком.
+    В памяти — только последние SNAPSHOT_CACHE_SIZE восстановленных снимков.
+    build_snapshot(payload, version, base=...) — EventService.build_snapshot.
+    """
+
+    def __init__(self, directory, build_snapshot, max_bytes=HISTORY_MAX_BYTES):
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._directory = directory
+        self._build_snapshot = build_snapshot
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()   # (сегмент, номер записи) -> Snapshot
+
+    def append(self, snapshot, payload):
+        """Дописать пакет, из которого собран snapshot. Вызывается по порядку версий."""
+        segment = self._writable_segment(snapshot.created_at)
+        # опорный кадр нужен и после разрыва в версиях (история была выключена, перезапуск) —
+        # дельта применима только к своей предыдущей версии
+        position, last_version = self._tail(segment)
+        keyframe = snapshot.version % KEYFRAME_EVERY == 0 or last_version != snapshot.version - 1
+        if keyframe:
+            _store_keyframe(self._keyframe_path(segment, position), snapshot)
+        data = zlib.compress(json_codec.dumps(payload), COMPRESS_LEVEL)
+        with open(self._path(segment, "history.log"), "ab") as f:
+            offset = f.tell()
+            f.write(_RECORD.pack(len(data)) + data)
+        with open(self._path(segment, "history.idx"), "ab") as f:
+            f.write(_ENTRY.pack(snapshot.created_at, snapshot.version, offset, keyframe))
+
+    def _path(self, segment, name):
+        return os.path.join(self._directory, segment, name)
+
+    def _keyframe_path(self, segment, position):
+        return os.path.join(self._directory, segment, "keyframes", f"{position}.pickle.z")
+
+    def _segments(self):
+        """Имена сегментов по возрастанию времени."""
+        return sorted(name for name in os.listdir(self._directory) if _SEGMENT_NAME.fullmatch(name))
+
+    def _writable_segment(self, created_at):
+        """Сегмент для записи в момент created_at; при переходе к новому — удаление старых."""
+        segments = self._segments()
+        day = time.strftime("%Y%m%d", time.localtime(created_at))
+        number = 1
+        if segments:
+            last = segments[-1]
+            last_day, last_number = last.split("-")
+            # часы сервера отстали — пишем в последний сегмент, порядок сегментов не нарушается
+            if last_day >= day:
+                try:
+                    size = os.path.getsize(self._path(last, "history.log"))
+                except FileNotFoundError:
+                    size = 0
+                if size < SEGMENT_MAX_BYTES:
+                    return last
+                day, number = last_day, int(last_number) + 1
+        segment = f"{day}-{number:04d}"
+        os.makedirs(os.path.join(self._directory, segment, "keyframes"), mode=0o700, exist_ok=True)
+        self._prune(segments)
+        return segment
+
+    def _prune(self, segments):
+        """Удалить самые старые из segments (новый сегмент в них не входит), пока история больше max_bytes."""
+        sizes = [_disk_size(os.path.join(self._directory, segment)) for segment in segments]
+        total = sum(sizes)
+        for segment, size in zip(segments, sizes):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(os.path.join(self._directory, segment), ignore_errors=True)
+            total -= size
+
+    def _tail(self, segment):
+        """(номер следующей записи индекса, версия последней записи или None)."""
+        index_path = self._path(segment, "history.idx")
+        try:
+            with open(index_path, "rb") as f:
+                size = f.seek(0, os.SEEK_END)
+                if size % _ENTRY.size:
+                    # недописанная запись после падения — новые пишутся после неё
+                    # и со сдвигом не прочитаются; отрезаем
+                    size -= size % _ENTRY.size
+                    os.truncate(index_path, size)
+                if size == 0:
+                    return 0, None
+                f.seek(size - _ENTRY.size)
+                return size // _ENTRY.size, _ENTRY.unpack(f.read(_ENTRY.size))[1]
+        except FileNotFoundError:
+            return 0, None
+
+    @contextmanager
+    def _index(self, segment):
+        """Индекс сегмента, отображённый в память (или b"" — записей нет, сегмент удалён)."""
+        try:
+            with open(self._path(segment, "history.idx"), "rb") as f:
+                index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            # ValueError — пустой файл (mmap нулевой длины)
+            yield b""
+            return
+        with index:
+            yield index
+
+    @staticmethod
+    def _bisect(index, when, inclusive=True):
+        """Число записей со временем <= when (inclusive) или < when."""
+        # недописанная последняя запись не учитывается
+        lo, hi = 0, len(index) // _ENTRY.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            created_at = _ENTRY.unpack_from(index, mid * _ENTRY.size)[0]
+            if created_at < when or (inclusive and created_at == when):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def timeline(self, start=None, end=None):
+        """[(время, версия)] записей истории в интервале [start, end] (None — без границы)."""
+        entries = []
+        for segment in self._segments():
+            with self._index(segment) as index:
+                first = 0 if start is None else self._bisect(index, start, inclusive=False)
+                last = len(index) // _ENTRY.size if end is None else self._bisect(index, end)
+                entries.extend(_ENTRY.unpack_from(index, i * _ENTRY.size)[:2] for i in range(first, last))
+        return entries
+
+    def snapshot_at(self, when):
+        """Snapshot, действовавший в момент when (unix-время), или None — тогда данных ещё не было."""
+        for segment in reversed(self._segments()):
+            with self._index(segment) as index:
+                position = self._bisect(index, when)
+                if position:
+                    return self._restore(segment, index, position - 1)
+        return None
+
+    def _restore(self, segment, index, position):
+        # назад до опорного кадра или уже восстановленного снимка (повтор гонки идёт подряд),
+        # затем пакеты после него
+        start = position
+        with self._lock:
+            while True:
+                snapshot = self._cache.get((segment, start))
+                if snapshot is not None:
+                    self._cache.move_to_end((segment, start))
+                    break
+                if _ENTRY.unpack_from(index, start * _ENTRY.size)[3]:
+                    break
+                start -= 1
+        try:
+            if snapshot is None:
+                snapshot = _load_keyframe(self._keyframe_path(segment, start))
+            with open(self._path(segment, "history.log"), "rb") as log:
+                for i in range(start + 1, position + 1):
+                    entry_time, version, offset, _keyframe = _ENTRY.unpack_from(index, i * _ENTRY.size)
+                    # поверх опорного кадра пакет применяется как дельта, даже если это тоже кадр
+                    log.seek(offset)
+                    size, = _RECORD.unpack(log.read(_RECORD.size))
+                    payload = json.loads(zlib.decompress(log.read(size)))
+                    snapshot = self._build_snapshot(payload, version, base=snapshot)
+                    snapshot.created_at = entry_time
+        except FileNotFoundError:
+            # сегмент удалили как старый, пока его читали
+            return None
+
+        with self._lock:
+            self._cache[(segment, position)] = snapshot
+            while len(self._cache) > SNAPSHOT_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return snapshot
+
+
+def _store_keyframe(path, snapshot):
+    """Записать Snapshot (pickle, zlib) атомарно — через временный файл и os.replace."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(zlib.compress(pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL), COMPRESS_LEVEL))
+    os.replace(tmp_path, path)
+
+
+def _load_keyframe(path):
+    with open(path, "rb") as f:
+        return pickle.loads(zlib.decompress(f.read()))
+
+
+def _disk_size(path):
+    """Сумма размеров файлов в каталоге path (рекурсивно)."""
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except FileNotFoundError:
+                pass
+    return total
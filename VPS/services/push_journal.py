@@ -0,0 +1,71 @@
+# services/push_journal.py
+import json
+import os
+
+from services import json_codec
+from services.shared_snapshot import load_snapshot_file, store_snapshot_file
+
+# Контрольный снимок — каждые CHECKPOINT_EVERY версий или когда журнал перерос JOURNAL_MAX_BYTES
+CHECKPOINT_EVERY = 10
+JOURNAL_MAX_BYTES = 32 * 1024 * 1024
+
+
+class PushJournal:
+    """
+    Журнал принятых push на диске — чтобы после перезапуска сервис сразу отдавал данные,
+    не дожидаясь следующего пакета от агента. В каталоге directory:
+      journal.log       — по строке JSON на push: {"version": N, "payload": пакет как пришёл (в т.ч. дельта)}
+      checkpoint.pickle — Snapshot на момент последнего контрольного снимка;
+                          после его записи журнал обнуляется
+    Запись — только из SnapshotStore.publish, по порядку версий.
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._log_path = os.path.join(directory, "journal.log")
+        self._checkpoint_path = os.path.join(directory, "checkpoint.pickle")
+
+    def append(self, snapshot, payload):
+        """Дописать пакет, из которого собран snapshot; при необходимости — контрольный снимок."""
+        line = json_codec.dumps({"version": snapshot.version, "payload": payload}) + b"\n"
+        with open(self._log_path, "ab") as f:
+            f.write(line)
+            size = f.tell()
+        if snapshot.version % CHECKPOINT_EVERY == 0 or size > JOURNAL_MAX_BYTES:
+            self.checkpoint(snapshot)
+
+    def checkpoint(self, snapshot):
+        store_snapshot_file(self._checkpoint_path, snapshot)
+        # строки до snapshot.version больше не нужны; если упадём до обнуления,
+        # replay их просто пропустит
+        with open(self._log_path, "wb"):
+            pass
+
+    def replay(self, build_snapshot):
+        """
+        Последний Snapshot: контрольный снимок (читается через mmap) плюс пакеты журнала после него,
+        собранные build_snapshot(payload, version, base=...). None — журнал пуст.
+        Недописанная последняя строка (падение во время записи) отрезается — иначе
+        к ней приклеилась бы следующая запись.
+        """
+        snapshot = load_snapshot_file(self._checkpoint_path)
+        try:
+            f = open(self._log_path, "r+b")
+        except FileNotFoundError:
+            return snapshot
+        with f:
+            good = 0
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("torn line")
+                    record = json.loads(line)
+                except ValueError:
+                    f.truncate(good)
+                    break
+                good += len(line)
+                version = record["version"]
+                if snapshot is not None and version <= snapshot.version:
+                    continue
+                snapshot = build_snapshot(record["payload"], version, base=snapshot)
+        return snapshot
@@ -0,0 +1,108 @@
+# services/response_cache.py
+import gzip
+import threading
+from collections import OrderedDict
+
+from services import metrics
+
+try:
+    import brotli
+except ImportError:  # необязательная зависимость — без неё отдаём gzip
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5      # 11 (по умолчанию) на мегабайтной таблице сжимает секунды
+MIN_COMPRESS_SIZE = 1024
+
+
+class CachedBody:
+    """
+    Готовое тело ответа: JSON в utf-8 и его сжатые варианты.
+    Каждый вариант сжимается один раз — при первом запросе с таким Accept-Encoding.
+    """
+    __slots__ = ("plain", "_encoded")
+
+    def __init__(self, plain):
+        self.plain = plain
+        self._encoded = {}
+
+    def negotiate(self, accept_encodings):
+        """(Content-Encoding или None, тело) по заголовку Accept-Encoding (request.accept_encodings)."""
+        if len(self.plain) < MIN_COMPRESS_SIZE:
+            return None, self.plain
+        if brotli is not None and accept_encodings["br"]:
+            return "br", self._compressed("br")
+        if accept_encodings["gzip"]:
+            return "gzip", self._compressed("gzip")
+        return None, self.plain
+
+    def _compressed(self, encoding):
+        body = self._encoded.get(encoding)
+        if body is None:
+            with metrics.stage(encoding):
+                if encoding == "br":
+                    body = brotli.compress(self.plain, quality=BROTLI_QUALITY)
+                else:
+                    body = gzip.compress(self.plain, GZIP_LEVEL, mtime=0)
+            # гонка двух потоков лишь сожмёт одно и то же дважды
+            self._encoded[encoding] = body
+        return body
+
+
+class ResponseCache:
+    """
+    LRU значений одной версии данных (CachedBody, собранные таблицы): key -> значение,
+    не больше max_entries, а с size(value) -> байты — и не больше max_bytes в сумме
+    (последнее добавленное значение остаётся, даже если одно больше max_bytes).
+    С первой записью новой версии значения старой выбрасываются целиком.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=None, size=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._size = size
+        self._lock = threading.Lock()
+        self._version = 0
+        self._entries = OrderedDict()   # key -> (значение, размер)
+        self._bytes = 0
+        self._building = {}             # (version, key) -> Event: значение уже собирает другой поток
+
+    def get(self, version, key, build):
+        """
+        Значение для (version, key); build() вызывается только при промахе.
+        Одновременные промахи по одному ключу ждут одну сборку, а не собирают каждый свою.
+        """
+        while True:
+            with self._lock:
+                if version > self._version:
+                    self._version = version
+                    self._entries.clear()
+                    self._bytes = 0
+                entry = self._entries.get(key) if version == self._version else None
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    return entry[0]
+                building = self._building.get((version, key))
+                if building is None:
+                    building = self._building[(version, key)] = threading.Event()
+                    break
+            building.wait()
+
+        try:
+            value = build()
+            size = self._size(value) if self._size is not None else 0
+            with self._lock:
+                if version == self._version:
+                    old = self._entries.pop(key, None)
+                    if old is not None:
+                        self._bytes -= old[1]
+                    self._entries[key] = (value, size)
+                    self._bytes += size
+                    while len(self._entries) > self.max_entries or (
+                            self.max_bytes is not None and self._bytes > self.max_bytes and len(self._entries) > 1):
+                        self._bytes -= self._entries.popitem(last=False)[1][1]
+        finally:
+            with self._lock:
+                del self._building[(version, key)]
+            building.set()
+        return value
@@ -0,0 +1,55 @@
+# services/result_table.py
+from array import array
+from sys import intern
+
+try:
+    import numpy as np
+except ImportError:  # необязательная зависимость — без неё те же вычисления на чистом Python
+    np = None
+
+# ниже этого размера накладные расходы NumPy больше выигрыша
+NUMPY_MIN_ROWS = 64
+
+
+class ResultTable:
+    """
+    Протокол одной отметки (GetResult) в колонках:
+      bibs, ids — общие (intern) строки: одни и те же номера повторяются во всех отметках гонки
+      values    — Result как в XML (None, если поля не было)
+      seconds   — array('d') со временем values в секундах, разобранным один раз
+    Behind не хранится: отставание всегда пересчитывается по seconds.
+    """
+    __slots__ = ("bibs", "ids", "values", "seconds")
+
+    def __init__(self, rows, to_seconds):
+        """rows — [(Bib, Id, Result, Behind)], to_seconds — функция разбора строки времени."""
+        self.bibs = [intern(r[0]) for r in rows]
+        self.ids = [intern(r[1]) for r in rows]
+        self.values = [r[2] for r in rows]
+        self.seconds = array("d", [to_seconds(v) for v in self.values])
+
+    def __len__(self):
+        return len(self.bibs)
+
+    def __iter__(self):
+        """Строки (Bib, Id, Result)."""
+        return zip(self.bibs, self.ids, self.values)
+
+
+def bib_key(bib):
+    """Порядок при равном времени: номера по числу, прочие — после, по строке."""
+    return (0, int(bib), "") if bib.isdigit() else (1, 0, bib)
+
+
+def order_by_time(seconds):
+    """Индексы по возрастанию времени; при равном времени сохраняется исходный порядок."""
+    if np is not None and len(seconds) >= NUMPY_MIN_ROWS:
+        return np.argsort(np.asarray(seconds, dtype=np.float64), kind="stable").tolist()
+    return sorted(range(len(seconds)), key=seconds.__getitem__)
+
+
+def gaps_to_leader(seconds, leader):
+    """Отставание каждого времени от leader (список float)."""
+    if np is not None and len(seconds) >= NUMPY_MIN_ROWS:
+        return (np.asarray(seconds, dtype=np.float64) - leader).tolist()
+    return [s - leader for s in seconds]
@@ -0,0 +1,100 @@
+# services/shared_snapshot.py
+import mmap
+import os
+import pickle
+import secrets
+import struct
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: общий снимок недоступен, остальное работает
+    fcntl = None
+
+_VERSION = struct.Struct("<Q")
+
+
+def load_snapshot_file(path):
+    """Snapshot из pickle-файла или None. Читается прямо из mmap, без копии в bytes."""
+    try:
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return pickle.loads(data)
+    except (FileNotFoundError, ValueError):
+        # ValueError — пустой файл (mmap нулевой длины)
+        return None
+
+
+def store_snapshot_file(path, snapshot):
+    """Записать Snapshot в pickle-файл атомарно (через временный файл и os.replace)."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+class SharedSnapshot:
+    """
+    Snapshot, общий для всех воркеров gunicorn (Linux/Unix).
+    В каталоге directory:
+      snapshot.pickle  — последний Snapshot (pickle), заменяется атомарно через os.replace
+      snapshot.version — 8 байт с его номером версии, отображены в память каждого воркера:
+                         проверка «есть ли новее» — чтение из mmap, без системных вызовов
+      snapshot.lock    — flock: публикации разных воркеров идут по очереди
+      snapshot.epoch   — эпоха нумерации версий (см. SnapshotStore.epoch), одна на все воркеры
+    Файлы пишет только сам сервис — каталог должен быть доступен лишь ему.
+    """
+
+    def __init__(self, directory):
+        if fcntl is None:
+            raise RuntimeError("SNAPSHOT_DIR поддерживается только на Linux/Unix")
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._data_path = os.path.join(directory, "snapshot.pickle")
+        self._lock_path = os.path.join(directory, "snapshot.lock")
+        fd = os.open(os.path.join(directory, "snapshot.version"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < _VERSION.size:
+                os.ftruncate(fd, _VERSION.size)
+            self._version_map = mmap.mmap(fd, _VERSION.size)
+        finally:
+            os.close(fd)
+        self.epoch = self._load_epoch(os.path.join(directory, "snapshot.epoch"))
+
+    @staticmethod
+    def _load_epoch(path):
+        # создаёт первый воркер; os.link не заменяет уже созданный другим воркером файл
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(secrets.token_hex(4))
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
+        with open(path) as f:
+            return f.read().strip()
+
+    def version(self):
+        """Номер последней опубликованной версии (0 — публикаций ещё не было)."""
+        return _VERSION.unpack_from(self._version_map)[0]
+
+    @contextmanager
+    def locked(self):
+        """Межпроцессная блокировка публикации."""
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def load(self):
+        """Последний Snapshot из файла или None."""
+        return load_snapshot_file(self._data_path)
+
+    def store(self, snapshot):
+        """Записать Snapshot и опубликовать его версию. Вызывать под locked()."""
+        store_snapshot_file(self._data_path, snapshot)
+        # версия пишется последней: увидевший её воркер найдёт уже готовый файл
+        _VERSION.pack_into(self._version_map, 0, snapshot.version)
@@ -0,0 +1,166 @@
+# services/snapshot.py
+import secrets
+import threading
+import time
+from contextlib import nullcontext
+
+from services import metrics
+
+# Как часто ожидающий SSE-поток проверяет общий снимок других воркеров (сек)
+SHARED_POLL = 0.2
+
+PUSH_BYTES = metrics.Histogram("ski_push_bytes", "Размер тела push от агента", buckets=metrics.SIZE_BUCKETS)
+PUSH_INTERVAL = metrics.Histogram("ski_push_interval_seconds", "Интервал между принятыми push",
+                                  buckets=(1, 2, 5, 10, 15, 30, 60, 120, 300, 600, 1800))
+SNAPSHOT_AGE = metrics.Histogram("ski_snapshot_age_seconds", "Возраст Snapshot, отданного клиенту",
+                                 buckets=(1, 2, 5, 10, 15, 30, 60, 120, 300, 600, 1800))
+
+
+class Snapshot:
+    """
+    Разобранный один раз срез данных последнего push.
+    После создания не изменяется — читатели получают ссылку без копирования.
+      version      — номер push (растёт с каждым принятым пакетом)
+      title        — MainTitle
+      participants — {Id: Participant} (Name, Club, CatId, ClassId)
+      schedule     — [{RaceId, RaceTitle, Rankings, StartDateTime}]
+      dates        — готовый результат group_dates
+      results      — {"raceid_rank": ResultTable}
+      hashes       — {"event_xml": sha1, "results": {"raceid_rank": sha1}} исходных документов
+      boards       — {RaceId: Leaderboard} финишировавших
+    """
+    __slots__ = ("version", "created_at", "title", "participants", "schedule", "dates", "results", "hashes",
+                 "boards")
+
+    def __init__(self, version, title, participants, schedule, dates, results, hashes, boards=None):
+        self.version = version
+        self.created_at = time.time()
+        self.title = title
+        self.participants = participants
+        self.schedule = schedule
+        self.dates = dates
+        self.results = results
+        self.hashes = hashes
+        self.boards = boards or {}
+
+
+class SnapshotStore:
+    """
+    Хранит текущий Snapshot и выдаёт номера версий.
+    shared — SharedSnapshot, если воркеров несколько: публикация пишет снимок в общий файл,
+    а current()/wait_newer() подхватывают снимки, опубликованные другими воркерами.
+    journal — PushJournal, history — PushHistory: каждый опубликованный пакет дописывается
+    в журнал для перезапуска и в историю дня.
+    epoch — случайная метка запуска: без журнала версии после перезапуска снова идут с 1,
+    и (epoch, version) отличает их от версий прошлого запуска (ETag, версия для клиента).
+    С shared — общая для всех воркеров.
+    """
+
+    def __init__(self, shared=None, journal=None, history=None):
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._version = 0
+        self._snapshot = None
+        self._shared = shared
+        self.epoch = shared.epoch if shared is not None else secrets.token_hex(4)
+        self._sync_lock = threading.Lock()
+        self._recorders = [recorder for recorder in (journal, history) if recorder is not None]
+        # с журналом/историей публикации идут по очереди — записи в них в порядке версий
+        self._publish_lock = threading.Lock() if self._recorders else nullcontext()
+
+    def publish(self, build, record=None):
+        """
+        build(version, base) -> Snapshot; base — последний Snapshot (или None).
+        record — исходный пакет для журнала и истории.
+        Без shared разбор выполняется вне блокировки, замена ссылки — атомарно;
+        более старая версия не перезапишет новую. С shared публикации всех воркеров
+        идут по очереди, а base — самый свежий снимок, от какого бы воркера он ни пришёл.
+        """
+        if self._shared is not None:
+            with self._shared.locked():
+                self._sync()
+                base = self._snapshot
+                snapshot = build(max(self._shared.version(), self._version) + 1, base)
+                self._shared.store(snapshot)
+                self._set(snapshot)
+                self._record(snapshot, base, record)
+            return snapshot
+
+        with self._publish_lock:
+            with self._lock:
+                self._version += 1
+                version = self._version
+                base = self._snapshot
+            snapshot = build(version, base)
+            self._set(snapshot)
+            self._record(snapshot, base, record)
+        return snapshot
+
+    def _record(self, snapshot, base, record):
+        if base is not None:
+            PUSH_INTERVAL.observe(snapshot.created_at - base.created_at)
+        for recorder in self._recorders:
+            with metrics.stage("journal"):
+                recorder.append(snapshot, record)
+
+    def restore(self, snapshot):
+        """Снимок, восстановленный из журнала при запуске; номера версий продолжатся с него."""
+        if snapshot is None:
+            return
+        if self._shared is not None:
+            with self._shared.locked():
+                # другой воркер мог уже восстановить (или принять новый push)
+                if self._shared.version() < snapshot.version:
+                    self._shared.store(snapshot)
+            self._sync()
+            return
+        self._set(snapshot)
+
+    def _set(self, snapshot):
+        with self._lock:
+            self._version = max(self._version, snapshot.version)
+            if self._snapshot is None or self._snapshot.version < snapshot.version:
+                self._snapshot = snapshot
+                self._changed.notify_all()
+
+    def _sync(self):
+        """Подтянуть из общего файла снимок, опубликованный другим воркером."""
+        if self._shared is None:
+            return
+        version = self._shared.version()
+        if version == 0 or (self._snapshot is not None and self._snapshot.version >= version):
+            return
+        # загружает один поток, остальные потоки воркера ждут его результат
+        with self._sync_lock:
+            if self._snapshot is not None and self._snapshot.version >= self._shared.version():
+                return
+            snapshot = self._shared.load()
+            if snapshot is not None:
+                self._set(snapshot)
+
+    def current(self, sync=True):
+        """Текущий Snapshot; sync=False — без проверки общего файла (её делает wait_newer)."""
+        if sync:
+            self._sync()
+        with self._lock:
+            return self._snapshot
+
+    def wait_newer(self, version, timeout=None):
+        """
+        Блокирует поток до появления Snapshot новее version (или до timeout).
+        Возвращает текущий Snapshot — вызывающий сам сравнивает версию.
+        С shared общий файл проверяется каждые SHARED_POLL секунд.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self._sync()
+            with self._lock:
+                if self._snapshot is not None and self._snapshot.version > version:
+                    return self._snapshot
+                wait = SHARED_POLL if self._shared is not None else None
+                if deadline is not None:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        return self._snapshot
+                    wait = left if wait is None else min(wait, left)
+                self._changed.wait(wait)
@@ -1,7 +1,12 @@
 // static/js/index.js
+let lastEtag = null;
+
 async function loadDates(){
-    const res = await fetch('/api/dates');
+    const headers = lastEtag ? {'If-None-Match': lastEtag} : {};
+    const res = await fetch('/api/dates', {headers: headers});
+    if(res.status === 304) return;
     const data = await res.json();
+    lastEtag = res.headers.get('ETag');
     if(data.error){ document.getElementById('dates').innerText = data.error; return; }
 
     document.getElementById('title').innerText = data.title || 'Календарь';
@@ -39,4 +44,8 @@ async function loadDates(){
         container.appendChild(box);
     });
 }
-window.addEventListener('load', loadDates);
+window.addEventListener('load', function(){
+    loadDates();
+    // пока данные не менялись, сервер отвечает 304 без тела
+    setInterval(loadDates, 30000);
+});
@@ -1,6 +1,25 @@
 // static/js/race.js
 let raceId = document.getElementById('raceId').value || '';
 let currentCat = '';
+let source = null;
+let streamErrors = 0;
+let pollTimer = null;
+
+// Виртуальная прокрутка: в DOM только видимые строки (и запас OVERSCAN),
+// строки приходят страницами по PAGE_SIZE из /api/live?format=columns
+const PAGE_SIZE = 100;
+const OVERSCAN = 10;
+let rowHeight = 37;      // уточняется по первой отрисованной строке
+let version = null;      // версия данных, к которой относятся страницы в pages
+let epoch = null;        // эпоха сервера: сменилась — сервер перезапускался и версии начались заново
+let total = 0;
+let columns = [];
+let headers = [];
+let pages = new Map();   // offset страницы -> values (массив значений на колонку)
+let etags = new Map();   // запрос страницы -> ETag
+let pending = new Map(); // запрос страницы -> Promise
+let renderQueued = false;
+let highlightBib = '';
 
 function buildQuery(){
     let q = '?race=' + encodeURIComponent(raceId);
@@ -8,12 +27,51 @@ function buildQuery(){
     return q;
 }
 
+function fetchPage(offset){
+    const query = buildQuery() + '&format=columns&offset=' + offset + '&limit=' + PAGE_SIZE;
+    if(pending.has(query)) return pending.get(query);
+    // ETag привязан к странице — отправляем, только если она у нас есть
+    const headers = (pages.has(offset) && etags.has(query)) ? {'If-None-Match': etags.get(query)} : {};
+    const request = fetch('/api/live' + query, {headers: headers}).then(async res => {
+        if(res.status === 304) return;  // с последнего push страница не изменилась
+        const data = await res.json();
+        etags.set(query, res.headers.get('ETag'));
+        applyPage(data);
+    }).finally(() => pending.delete(query));
+    pending.set(query, request);
+    return request;
+}
+
+// Обновление: запрашиваем страницу с первой видимой строкой — если версия
+// данных сменилась, остальные видимые страницы догрузит renderRows
 async function loadRace(){
     if(!raceId) { document.getElementById('tbody').innerText = 'race param missing'; return; }
-    const res = await fetch('/api/live' + buildQuery());
-    const data = await res.json();
-    if(!data.rows) { document.getElementById('tbody').innerText = 'Нет данных'; return; }
+    const first = Math.min(firstVisibleRow(), Math.max(total - 1, 0));
+    await fetchPage(first - first % PAGE_SIZE);
+}
+
+function applyPage(data){
+    if(!data.values) { document.getElementById('tbody').innerText = 'Нет данных'; return; }
+    if(data.epoch !== epoch){
+        epoch = data.epoch;
+        forgetPages();
+    }
+    if(data.version !== version){
+        if(version !== null && data.version < version){
+            // ответ опоздал — данные уже новее, страницу перезапросит renderRows
+            scheduleRender();
+            return;
+        }
+        version = data.version;
+        pages.clear();
+        renderMeta(data);
+    }
+    total = data.total;
+    pages.set(data.offset, data.values);
+    scheduleRender();
+}
 
+function renderMeta(data){
     document.getElementById('title').innerText = data.race_title;
 
     const cat = document.getElementById('catSelect');
@@ -24,30 +82,131 @@ async function loadRace(){
         cat.appendChild(opt);
     });
     cat.value = data.selected_cat || '';
-    cat.onchange = function(){ currentCat = this.value; loadRace(); }
+    cat.onchange = function(){ currentCat = this.value; resetTable(); loadRace(); }
 
+    columns = data.columns;
+    headers = data.headers;
     let header = '<tr class="bg-slate-700">';
     header += '<th>№</th><th>Имя</th><th>Клуб</th>';
-    data.headers.forEach(h => header += '<th>' + h + '</th>');
+    headers.forEach(h => header += '<th>' + h + '</th>');
     header += '</tr>';
     document.getElementById('thead').innerHTML = header;
+}
 
-    let body = '';
-    data.rows.forEach(r=>{
-        body += '<tr class="border-t border-slate-700">';
-        body += '<td>' + (r.Bib || '') + '</td>';
-        body += '<td>' + (r.Name || '') + '</td>';
-        body += '<td>' + (r.Club || '') + '</td>';
-        data.headers.forEach(h=>{
-            body += '<td>' + (r[h] !== undefined ? r[h] : '') + '</td>';
-        });
+// Страницы и ETag прежней версии больше не годятся — например, после перезапуска
+// сервера новые версии меньше старых, и applyPage иначе отбрасывала бы их как опоздавшие
+function forgetPages(){
+    version = null;
+    pages.clear();
+    etags.clear();
+}
+
+function resetTable(){
+    forgetPages();
+    total = 0;
+    document.getElementById('tableWrap').scrollTop = 0;
+}
+
+function firstVisibleRow(){
+    const wrap = document.getElementById('tableWrap');
+    const top = wrap.scrollTop - document.getElementById('thead').offsetHeight;
+    return Math.max(0, Math.floor(top / rowHeight));
+}
+
+function scheduleRender(){
+    if(renderQueued) return;
+    renderQueued = true;
+    requestAnimationFrame(renderRows);
+}
+
+function renderRows(){
+    renderQueued = false;
+    const wrap = document.getElementById('tableWrap');
+    const tbody = document.getElementById('tbody');
+    const colspan = headers.length + 3;
+    const first = Math.max(0, Math.min(firstVisibleRow(), total) - OVERSCAN);
+    const last = Math.min(total, firstVisibleRow() + Math.ceil(wrap.clientHeight / rowHeight) + OVERSCAN);
+    const picks = ['Bib', 'Name', 'Club'].concat(headers).map(c => columns.indexOf(c));
+
+    let body = '<tr style="height:' + first * rowHeight + 'px"><td colspan="' + colspan + '" style="padding:0;border:0"></td></tr>';
+    for(let i = first; i < last; i++){
+        const offset = i - i % PAGE_SIZE;
+        const values = pages.get(offset);
+        if(!values){
+            fetchPage(offset);
+            body += '<tr class="border-t border-slate-700 vrow"><td colspan="' + colspan + '">…</td></tr>';
+            continue;
+        }
+        const j = i - offset;
+        const bib = values[picks[0]][j];
+        body += '<tr class="border-t border-slate-700 vrow' + (bib === highlightBib ? ' bg-blue-900' : '') + '">';
+        picks.forEach(k => body += '<td>' + (k >= 0 ? values[k][j] : '') + '</td>');
         body += '</tr>';
+    }
+    body += '<tr style="height:' + (total - last) * rowHeight + 'px"><td colspan="' + colspan + '" style="padding:0;border:0"></td></tr>';
+    tbody.innerHTML = body;
+
+    // высота строки зависит от шрифта и ширины экрана — меряем по факту
+    const row = tbody.querySelector('tr.vrow');
+    if(row && Math.abs(row.offsetHeight - rowHeight) > 1){
+        rowHeight = row.offsetHeight;
+        scheduleRender();
+    }
+}
+
+async function findBib(){
+    const bib = document.getElementById('bibInput').value.trim();
+    if(!bib || !raceId) return;
+    const res = await fetch('/api/live' + buildQuery() + '&format=columns&limit=1&around=' + encodeURIComponent(bib));
+    const data = await res.json();
+    if(!data.values || data.values[data.columns.indexOf('Bib')][0] !== bib){
+        alert('Номер ' + bib + ' не найден');
+        return;
+    }
+    highlightBib = bib;
+    const wrap = document.getElementById('tableWrap');
+    wrap.scrollTop = document.getElementById('thead').offsetHeight + data.offset * rowHeight - wrap.clientHeight / 2;
+    scheduleRender();
+}
+
+function startPolling(){
+    if(pollTimer) return;
+    loadRace();
+    pollTimer = setInterval(loadRace, 3000);
+}
+
+// Основной режим — SSE: сервер сообщает номер версии после каждого push,
+// видимые строки запрашиваются через /api/live.
+// Если поток недоступен (старый браузер, прокси режет соединение) — опрос раз в 3 с.
+function startLive(){
+    if(!raceId) { document.getElementById('tbody').innerText = 'race param missing'; return; }
+    if(source) { source.close(); source = null; }
+    if(pollTimer) { loadRace(); return; }
+    if(!window.EventSource) { startPolling(); return; }
+
+    streamErrors = 0;
+    source = new EventSource('/api/live/stream' + buildQuery() + '&notify=1');
+    source.addEventListener('version', function(e){
+        streamErrors = 0;
+        // id события — "<эпоха>.<версия>"
+        const streamEpoch = e.lastEventId.split('.')[0];
+        if((epoch !== null && streamEpoch !== epoch) || (version !== null && Number(e.data) < version)) forgetPages();
+        if(Number(e.data) !== version) loadRace();
     });
-    document.getElementById('tbody').innerHTML = body;
+    source.onerror = function(){
+        // EventSource сам переподключается; после нескольких неудач подряд сдаёмся
+        streamErrors += 1;
+        if(source.readyState === EventSource.CLOSED || streamErrors >= 3){
+            source.close();
+            source = null;
+            startPolling();
+        }
+    };
 }
 
 document.getElementById('btnRefresh').addEventListener('click', loadRace);
-window.addEventListener('load', function(){
-    loadRace();
-    setInterval(loadRace, 3000);
-});
+document.getElementById('btnFind').addEventListener('click', findBib);
+document.getElementById('bibInput').addEventListener('keydown', function(e){ if(e.key === 'Enter') findBib(); });
+document.getElementById('tableWrap').addEventListener('scroll', scheduleRender);
+window.addEventListener('resize', scheduleRender);
+window.addEventListener('load', startLive);
@@ -0,0 +1,32 @@
+# tests/conftest.py
+import os
+import sys
+
+import pytest
+
+# Запуск: cd VPS && python -m pytest (или pytest VPS/tests из корня).
+# services — пакет VPS; «python -m pytest» из корня репозитория подхватил бы
+# одноимённый пакет локального приложения. Синтетические протоколы — из bench/payload_gen.py
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "..", "bench"))
+sys.path.insert(0, os.path.dirname(HERE))
+
+
+@pytest.fixture(scope="session")
+def ski_sender():
+    """Модуль агента (корень репозитория). Он импортирует свой пакет services —
+    на время импорта пакет VPS убирается из sys.modules и возвращается после."""
+    root = os.path.abspath(os.path.join(HERE, "..", ".."))
+    saved = {name: module for name, module in sys.modules.items()
+             if name == "services" or name.startswith("services.")}
+    for name in saved:
+        del sys.modules[name]
+    sys.path.insert(0, root)
+    try:
+        import ski_sender
+    finally:
+        sys.path.remove(root)
+        for name in [name for name in sys.modules if name == "services" or name.startswith("services.")]:
+            del sys.modules[name]
+        sys.modules.update(saved)
+    return ski_sender
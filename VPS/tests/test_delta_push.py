@@ -0,0 +1,88 @@
+# tests/test_delta_push.py
+import json
+
+import pytest
+
+from payload_gen import SyntheticEvent
+from services.event_service import EventService
+from services.snapshot import SnapshotStore
+
+
+@pytest.fixture(scope="module")
+def event():
+    return SyntheticEvent(participants=400, races=2, rankings=4, finish_share=0.85, seed=7)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    import app
+    from services import live_views
+    monkeypatch.setattr(live_views, "snapshots", SnapshotStore())
+    client = app.app.test_client()
+
+    def push(payload):
+        return client.post("/api/push", data=json.dumps(payload),
+                           headers={"Authorization": f"Bearer {app.SECRET_TOKEN}",
+                                    "Content-Type": "application/json"})
+    return push
+
+
+def test_snapshot_matches_payload_across_delta_pushes(event, ski_sender):
+    svc = EventService()
+    snapshot = None
+    sent = {}
+    duration = event.duration()
+    for version, elapsed in enumerate((0, duration * 0.3, duration * 0.6, duration * 0.9, None), 1):
+        full = event.payload(elapsed)
+        delta, sent = ski_sender.build_push(full["event_xml"], full["results"], sent)
+        if version > 1:
+            assert "event_xml" not in delta
+        assert svc.valid_push(delta)
+        assert not svc.missing_documents(snapshot, delta)
+        snapshot = svc.build_snapshot(delta, version, base=snapshot)
+
+        parsed = svc.parse_eventdata_from_payload(full)
+        for race in ("1", "2"):
+            for cat in ("", "M21", "W65"):
+                expected = svc.build_live_from_payload(parsed, full, race, cat)
+                assert svc.build_live_from_snapshot(snapshot, race, cat) == expected, (version, race, cat)
+
+
+def test_delta_without_base_needs_resync(event, ski_sender):
+    svc = EventService()
+    full = event.payload(None)
+    _, sent = ski_sender.build_push(full["event_xml"], full["results"], {})
+    delta, _ = ski_sender.build_push(full["event_xml"], full["results"], sent)
+    missing = svc.missing_documents(None, delta)
+    assert "event_xml" in missing and len(missing) == 1 + len(full["results"])
+
+
+@pytest.mark.parametrize("payload", [
+    {"results": ["x"]},
+    {"results": {"1_1": 5}},
+    {"event_xml": {"a": 1}},
+    {"hashes": "x"},
+    {"hashes": {"results": ["1_1"]}},
+    {"hashes": {"event_xml": 1}},
+    [1, 2],
+])
+def test_malformed_push_rejected(client, payload):
+    assert client(payload).status_code == 400
+
+
+def test_null_hash_needs_resync(client, event):
+    # нет ни тела, ни хеша — документ взять неоткуда
+    resp = client({"hashes": {"results": {"1_1": None}}})
+    assert resp.status_code == 409 and resp.get_json()["missing"] == ["event_xml", "1_1"]
+
+    full = event.payload(None)
+    assert client(full).status_code == 200
+    resp = client({"hashes": {"event_xml": None, "results": {}}})
+    assert resp.status_code == 409 and resp.get_json()["missing"] == ["event_xml"]
+
+
+def test_legacy_full_push_accepted(client, event):
+    full = event.payload(None)
+    full["results"]["9_9"] = None
+    resp = client(full)
+    assert resp.status_code == 200 and resp.get_json()["changed"]
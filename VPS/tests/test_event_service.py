@@ -0,0 +1,58 @@
+# tests/test_event_service.py
+import re
+
+import pytest
+
+from payload_gen import SyntheticEvent
+from services.event_service import EventService
+from services.leaderboard import Leaderboard
+
+
+@pytest.fixture(scope="module")
+def event():
+    return SyntheticEvent(participants=400, races=2, rankings=4, finish_share=0.85, seed=7)
+
+
+def test_unknown_race_falls_back_to_first(event):
+    svc = EventService()
+    snapshot = svc.build_snapshot(event.payload(None), 1)
+    assert svc.build_live_from_snapshot(snapshot, "nope")["race_id"] == snapshot.schedule[0]["RaceId"]
+
+
+def test_leaderboard_ties_ordered_by_bib():
+    board = Leaderboard().updated({
+        "10": (60.0, "M21", "1:00.0"),
+        "2": (60.0, "M21", "1:00.0"),
+        "x1": (60.0, "W21", "1:00.0"),
+        "7": (59.5, "W21", "59.5"),
+    })
+    assert [bib for _, bib, _ in board.standings()] == ["7", "2", "10", "x1"]
+    assert [bib for _, bib, _ in board.standings("M21")] == ["2", "10"]
+
+    # изменился один номер — переставлен только он
+    board = board.updated({
+        "10": (58.0, "M21", "58.0"),
+        "2": (60.0, "M21", "1:00.0"),
+        "x1": (60.0, "W21", "1:00.0"),
+    })
+    assert [bib for _, bib, _ in board.standings()] == ["10", "2", "x1"]
+    assert [bib for _, bib, _ in board.standings("W21")] == ["x1"]
+
+
+def test_fallback_ties_ordered_by_bib():
+    event = SyntheticEvent(participants=10, races=1, rankings=3, finish_share=1, seed=7)
+    payload = event.payload(None)
+    # стартовый протокол в обратном порядке номеров, 2 и 10 финишировали одновременно
+    head, *rows = payload["results"]["1_1"].split("<a:clsInfoResultRow>")
+    rows[-1], tail = rows[-1].split("</a:Rows>")
+    payload["results"]["1_1"] = "<a:clsInfoResultRow>".join([head] + rows[::-1]) + "</a:Rows>" + tail
+    payload["results"]["1_3"] = re.sub(r"(<a:Bib>(?:2|10)</a:Bib><a:Id>\d+</a:Id><a:Name>[^<]*</a:Name>"
+                                       r"<a:Result>)[^<]*", r"\g<1>30:00.0", payload["results"]["1_3"])
+
+    svc = EventService()
+    parsed = svc.parse_eventdata_from_payload(payload)
+    live = svc.build_live_from_payload(parsed, payload, "1")
+    bibs = [r["Bib"] for r in live["rows"] if r["Bib"] in ("2", "10")]
+    assert bibs == ["2", "10"]
+    # то же, что по Leaderboard снимка
+    assert svc.build_live_from_snapshot(svc.build_snapshot(payload, 1), "1") == live
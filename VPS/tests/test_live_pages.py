@@ -0,0 +1,24 @@
+# tests/test_live_pages.py
+import pytest
+
+from payload_gen import SyntheticEvent
+from services.event_service import EventService
+
+
+@pytest.fixture(scope="module")
+def event():
+    return SyntheticEvent(participants=400, races=2, rankings=4, finish_share=0.85, seed=7)
+
+
+def test_slice_live_around(event):
+    svc = EventService()
+    live = svc.build_live_from_snapshot(svc.build_snapshot(event.payload(None), 1), "1")
+    bib = live["rows"][50]["Bib"]
+    page = svc.slice_live(live, limit=10, around=bib, columnar=True)
+    assert page["offset"] == 45 and page["total"] == len(live["rows"])
+    assert page["values"][page["columns"].index("Bib")][5] == bib
+    assert "rows" in live and "rows" not in page
+    assert svc.page_offset(live, 0, 10, bib) == 45
+    assert svc.page_offset(live, 10 ** 6, 10) == len(live["rows"])
+    # неизвестный номер — окно с offset, как без around
+    assert svc.page_offset(live, 20, 10, "nope") == 20
@@ -0,0 +1,88 @@
+# tests/test_profiling.py
+import asyncio
+import cProfile
+import os
+import pstats
+import threading
+
+import pytest
+
+from services import profiling
+
+
+@pytest.fixture
+def enabled(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "ENABLED", True)
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILE_RATE", 1.0)
+    return tmp_path
+
+
+def test_nested_and_concurrent_calls(enabled):
+    inner = profiling.profiled("inner")(lambda x: x + 1)
+    started, release = threading.Event(), threading.Event()
+
+    @profiling.profiled("outer")
+    def outer(x):
+        started.set()
+        release.wait(5)
+        return inner(x) * 2
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(outer(1)))
+    thread.start()
+    started.wait(5)
+    # профилировщик занят другим потоком — вызов идёт без профиля, но идёт
+    assert inner(10) == 11
+    release.set()
+    thread.join()
+    assert results == [4]
+    assert not profiling._busy.locked()
+
+
+def test_enable_failure_runs_unprofiled(enabled, monkeypatch):
+    def busy(self):
+        raise ValueError("Another profiling tool is already active")
+    monkeypatch.setattr(cProfile.Profile, "enable", busy)
+
+    func = profiling.profiled("func")(lambda: "ok")
+    assert func() == "ok"
+    assert not profiling._busy.locked()
+    assert not any(name.endswith(".prof") for name in os.listdir(enabled))
+
+
+def profiled_functions(path):
+    return {func for _, _, func in pstats.Stats(str(path)).stats}
+
+
+def test_requested_profile_covers_executor_work(enabled, monkeypatch):
+    import app_async
+    monkeypatch.setattr(profiling, "PROFILE_RATE", 0.0)
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "secret")
+
+    def build_table():
+        return sum(range(1000))
+    build = profiling.profiled("build")(build_table)
+
+    async def handler():
+        profiling.start_request("secret")
+        # таблица собирается в пуле потоков, как в app_async.api_live
+        return await app_async._in_executor(build)
+
+    assert asyncio.run(handler()) == sum(range(1000))
+    assert "build_table" in profiled_functions(enabled / f"build.{os.getpid()}.prof")
+
+
+def test_pending_profiles_written_at_exit(enabled, monkeypatch):
+    at_exit = []
+    monkeypatch.setattr(profiling.atexit, "register", at_exit.append)
+
+    def build_table():
+        return sum(range(1000))
+    build = profiling.profiled("build")(build_table)
+    build()
+    path = enabled / f"build.{os.getpid()}.prof"
+    assert not path.exists()
+    for flush in at_exit:
+        flush()
+    assert "build_table" in profiled_functions(path)
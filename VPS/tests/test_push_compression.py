@@ -0,0 +1,110 @@
+# tests/test_push_compression.py
+import gzip
+import io
+import json
+
+import pytest
+
+from services import push_codec
+
+BODY = b'{"event_xml": "' + b"x" * 100000 + b'"}'
+
+
+def test_identity():
+    assert push_codec.decode_body(io.BytesIO(BODY), None, len(BODY)) == (BODY, len(BODY))
+    with pytest.raises(push_codec.PushTooLarge):
+        push_codec.decode_body(io.BytesIO(BODY), "identity", len(BODY) - 1)
+
+
+def test_identity_reads_in_chunks():
+    class Source(io.BytesIO):
+        sizes = []
+
+        def read(self, size=-1):
+            self.sizes.append(size)
+            return super().read(size)
+
+    source = Source(BODY)
+    assert push_codec.decode_body(source, "identity", 64 * 1024 * 1024)[0] == BODY
+    assert max(source.sizes) <= push_codec.CHUNK_SIZE
+
+
+def test_gzip():
+    wire = gzip.compress(BODY)
+    assert push_codec.decode_body(io.BytesIO(wire), "gzip", len(BODY)) == (BODY, len(wire))
+
+
+def test_gzip_bomb():
+    # 64 МБ нулей сжимаются в десятки КБ — распаковка останавливается на лимите
+    wire = gzip.compress(b"\0" * (64 * 1024 * 1024))
+    with pytest.raises(push_codec.PushTooLarge):
+        push_codec.decode_body(io.BytesIO(wire), "gzip", 1024 * 1024)
+
+
+def test_gzip_broken():
+    wire = gzip.compress(BODY)
+    with pytest.raises(ValueError):
+        push_codec.decode_body(io.BytesIO(wire[:len(wire) // 2]), "gzip", len(BODY))
+    with pytest.raises(ValueError):
+        push_codec.decode_body(io.BytesIO(b"not gzip at all"), "gzip", len(BODY))
+
+
+def test_zstd():
+    zstandard = pytest.importorskip("zstandard")
+    wire = zstandard.ZstdCompressor().compress(BODY)
+    assert push_codec.decode_body(io.BytesIO(wire), "zstd", len(BODY)) == (BODY, len(wire))
+    with pytest.raises(push_codec.PushTooLarge):
+        push_codec.decode_body(io.BytesIO(wire), "zstd", len(BODY) - 1)
+    with pytest.raises(ValueError):
+        push_codec.decode_body(io.BytesIO(b"not zstd"), "zstd", len(BODY))
+
+
+def test_unsupported():
+    with pytest.raises(push_codec.UnsupportedEncoding):
+        push_codec.decode_body(io.BytesIO(BODY), "br", len(BODY))
+
+
+@pytest.mark.parametrize("encoding", ["zstd", "gzip", "identity"])
+def test_sender_body_round_trip(ski_sender, encoding):
+    if encoding == "zstd" and (ski_sender.zstandard is None or push_codec.zstandard is None):
+        pytest.skip("zstandard не установлен")
+    payload = {"event_xml": "<xml/>", "results": {"1_1": "ж" * 1000}}
+    body = ski_sender.encode_push(payload, encoding)
+    decoded, wire = push_codec.decode_body(io.BytesIO(body), encoding, 1024 * 1024)
+    assert json.loads(decoded) == payload and wire == len(body)
+
+
+class Response:
+    def __init__(self, status_code, accept=""):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = {"Accept-Encoding": accept} if accept else {}
+
+
+def test_sender_steps_down_only_for_unsupported_encoding(ski_sender):
+    now = [0.0]
+    encoding = ski_sender.PushEncoding("zstd", clock=lambda: now[0])
+    # старый VPS без распаковки: первый же пакет — 400
+    assert encoding.on_response(Response(400)) == "gzip"
+    assert encoding.on_response(Response(200)) is None and encoding.for_push() == "gzip"
+    # gzip уже принимался — 400 теперь ошибка пакета, сжатие остаётся
+    assert encoding.on_response(Response(400)) is None and encoding.for_push() == "gzip"
+    # 415 — всегда отказ от сжатия, следующее — из Accept-Encoding
+    assert encoding.on_response(Response(415, "identity")) == "identity"
+    assert encoding.on_response(Response(400)) is None
+
+
+def test_sender_retries_preferred_encoding(ski_sender):
+    now = [0.0]
+    encoding = ski_sender.PushEncoding("zstd", clock=lambda: now[0])
+    assert encoding.for_push() == "zstd"
+    assert encoding.on_response(Response(415, "gzip, identity")) == "gzip"
+    encoding.on_response(Response(200))
+    now[0] += ski_sender.ENCODING_RETRY - 1
+    assert encoding.for_push() == "gzip"
+    now[0] += 1
+    assert encoding.for_push() == "zstd" and not encoding.confirmed
+    # VPS обновили — zstd принят и остаётся
+    assert encoding.on_response(Response(200)) is None
+    now[0] += ski_sender.ENCODING_RETRY
+    assert encoding.for_push() == "zstd"
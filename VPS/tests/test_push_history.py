@@ -0,0 +1,64 @@
+# tests/test_push_history.py
+import os
+
+import pytest
+
+from payload_gen import SyntheticEvent
+from services import push_history
+from services.event_service import EventService
+from services.push_history import PushHistory
+
+DAY = 24 * 3600
+
+
+@pytest.fixture
+def pushes():
+    event = SyntheticEvent(participants=200, races=1, rankings=3, seed=5)
+    duration = event.duration()
+    return [event.payload(duration * step / 30) for step in range(30)]
+
+
+def record(history, svc, payloads, start, step=60.0):
+    """Опубликовать пакеты с created_at = start, start + step, ...; [(время, таблица)]."""
+    snapshot = None
+    seen = []
+    for i, payload in enumerate(payloads):
+        snapshot = svc.build_snapshot(payload, i + 1, base=snapshot)
+        snapshot.created_at = start + i * step
+        history.append(snapshot, payload)
+        seen.append((snapshot.created_at, svc.build_live_from_snapshot(snapshot, "1")))
+    return seen
+
+
+def test_snapshot_at_across_days(tmp_path, pushes):
+    svc = EventService()
+    history = PushHistory(str(tmp_path), svc.build_snapshot)
+    # 30 пакетов раз в час, начиная за 10 часов до полуночи — два сегмента
+    start = 1_790_000_000 - 1_790_000_000 % DAY - 10 * 3600 - 3 * 3600
+    seen = record(history, svc, pushes, start, step=3600.0)
+    assert len(history._segments()) >= 2
+
+    for when, live in seen:
+        assert svc.build_live_from_snapshot(history.snapshot_at(when + 1), "1") == live
+    assert history.snapshot_at(start - 1) is None
+    assert [t for t, _ in history.timeline()] == [t for t, _ in seen]
+    assert len(history.timeline(seen[5][0], seen[20][0])) == 16
+
+
+def test_segment_size_and_pruning(tmp_path, pushes, monkeypatch):
+    monkeypatch.setattr(push_history, "SEGMENT_MAX_BYTES", 20 * 1024)
+    svc = EventService()
+    history = PushHistory(str(tmp_path), svc.build_snapshot, max_bytes=120 * 1024)
+    seen = record(history, svc, pushes, 1_790_000_000)
+
+    segments = history._segments()
+    assert len(segments) > 1
+    # старые сегменты удаляются при переходе к новому — лимит соблюдают все, кроме текущего
+    assert sum(push_history._disk_size(os.path.join(str(tmp_path), s)) for s in segments[:-1]) <= 120 * 1024
+    first = history.timeline()[0][0]
+    assert first > seen[0][0]
+    # удалённое время — нет данных; оставшееся восстанавливается
+    assert history.snapshot_at(seen[0][0]) is None
+    when, live = seen[-1]
+    assert svc.build_live_from_snapshot(history.snapshot_at(when), "1") == live
+    assert svc.build_live_from_snapshot(history.snapshot_at(first), "1") == next(l for t, l in seen if t == first)
@@ -0,0 +1,44 @@
+# tests/test_response_cache.py
+import threading
+import time
+
+from services.response_cache import ResponseCache
+
+
+def test_byte_limit():
+    cache = ResponseCache(max_entries=10, max_bytes=100, size=len)
+    for key in "abc":
+        cache.get(1, key, lambda: b"x" * 40)
+    # "a" вытеснен: 3 * 40 > 100
+    assert cache.get(1, "a", lambda: b"new") == b"new"
+    assert cache.get(1, "c", lambda: b"new") == b"x" * 40
+    # значение больше лимита всё равно остаётся последним
+    assert cache.get(1, "big", lambda: b"y" * 500) == b"y" * 500
+    assert cache.get(1, "big", lambda: b"new") == b"y" * 500
+
+
+def test_new_version_clears():
+    cache = ResponseCache(max_entries=2)
+    cache.get(1, "a", lambda: "v1")
+    assert cache.get(2, "a", lambda: "v2") == "v2"
+    # запоздавший запрос старой версии не попадает в кэш
+    assert cache.get(1, "a", lambda: "old") == "old"
+    assert cache.get(2, "a", lambda: "new") == "v2"
+
+
+def test_concurrent_misses_build_once():
+    cache = ResponseCache()
+    builds = []
+
+    def build():
+        builds.append(1)
+        time.sleep(0.05)
+        return "table"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(1, "a", build))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["table"] * 8 and len(builds) == 1
@@ -0,0 +1,63 @@
+# tests/test_warm_restart.py
+import pytest
+
+from payload_gen import SyntheticEvent
+from services import push_journal
+from services.event_service import EventService
+from services.push_journal import PushJournal
+from services.snapshot import SnapshotStore
+
+
+@pytest.fixture
+def pushes():
+    event = SyntheticEvent(participants=200, races=1, rankings=3, seed=3)
+    duration = event.duration()
+    return [event.payload(duration * step / 12) for step in range(12)]
+
+
+def publish(journal, svc, payloads, snapshot=None):
+    for payload in payloads:
+        snapshot = svc.build_snapshot(payload, (snapshot.version if snapshot else 0) + 1, base=snapshot)
+        journal.append(snapshot, payload)
+    return snapshot
+
+
+def test_replay_after_checkpoint(tmp_path, pushes):
+    svc = EventService()
+    last = publish(PushJournal(str(tmp_path)), svc, pushes)
+    assert last.version > push_journal.CHECKPOINT_EVERY
+
+    restored = PushJournal(str(tmp_path)).replay(svc.build_snapshot)
+    assert restored.version == last.version
+    assert svc.build_live_from_snapshot(restored, "1") == svc.build_live_from_snapshot(last, "1")
+
+
+def test_replay_truncates_torn_line(tmp_path, pushes):
+    svc = EventService()
+    journal = PushJournal(str(tmp_path))
+    last = publish(journal, svc, pushes[:3])
+    log_path = tmp_path / "journal.log"
+    with open(log_path, "ab") as f:
+        f.write(b'{"version": 4, "payl')
+
+    assert PushJournal(str(tmp_path)).replay(svc.build_snapshot).version == last.version
+    # следующая запись не склеивается с оборванной
+    last = publish(journal, svc, pushes[3:4], last)
+    assert PushJournal(str(tmp_path)).replay(svc.build_snapshot).version == last.version == 4
+
+
+def test_store_continues_versions_after_restart(tmp_path, pushes):
+    svc = EventService()
+    store = SnapshotStore(journal=PushJournal(str(tmp_path)))
+    for payload in pushes[:5]:
+        store.publish(lambda version, base: svc.build_snapshot(payload, version, base=base), record=payload)
+
+    # перезапуск: новый процесс восстанавливает снимок из журнала
+    journal = PushJournal(str(tmp_path))
+    restarted = SnapshotStore(journal=journal)
+    restarted.restore(journal.replay(svc.build_snapshot))
+    assert restarted.current().version == 5
+    snapshot = restarted.publish(lambda version, base: svc.build_snapshot(pushes[5], version, base=base),
+                                 record=pushes[5])
+    assert snapshot.version == 6
+    assert PushJournal(str(tmp_path)).replay(svc.build_snapshot).version == 6
@@ -1,11 +1,52 @@
 # app.py
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from services.event_service import EventService, run_sync
+from services import json_codec, metrics, profiling
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON-провайдер Flask на json_codec.dumps(): jsonify() отдаёт готовые bytes без промежуточной строки.
+    Порядок ключей сохраняется (sort_keys не применяется).
+    """
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return json_codec.dumps(obj, default=self.default).decode("utf-8")
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(json_codec.dumps(obj, default=self.default), mimetype=self.mimetype)
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
+# jsonify через orjson (если установлен) — сразу в bytes, кириллица без экранирования
+app.json = FastJSONProvider(app)
 
 event_svc = EventService()  # создаём сервис (использует SOAP клиент внутри)
 
+@app.before_request
+def _start_metrics():
+    metrics.start_request()
+
+@app.after_request
+def _finish_metrics(resp):
+    # этапы запроса (event_data, table, json) — в Server-Timing, видно в DevTools браузера
+    endpoint = request.url_rule.rule if request.url_rule is not None else "other"
+    resp.headers["Server-Timing"] = metrics.finish_request(endpoint, resp.status_code)
+    return resp
+
+if profiling.ENABLED:
+    # PROFILE_DIR задан — ?profile=<PROFILE_TOKEN> профилирует запрос (см. services/profiling.py)
+    @app.before_request
+    def _start_profiling():
+        profiling.start_request(request.args.get("profile", ""))
+
+# Метрики в формате Prometheus: SOAP по действиям, разбор XML, сборка таблицы, ответы
+@app.route("/metrics")
+def metrics_page():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 # Главная — список дат и гонок
 @app.route("/")
 def index():
@@ -21,24 +62,30 @@ def race_page():
 # API: даты + гонки
 @app.route("/api/dates")
 def api_dates():
-    data = run_sync(event_svc.fetch_event_data())
+    with metrics.stage("event_data"):
+        data = run_sync(event_svc.fetch_event_data())
     if not data:
         return jsonify({"error": "Не удалось получить данные"}), 500
 
     dates = run_sync(event_svc.get_dates_grouped_by_date(data))
-    return jsonify({"title": data.get("title", ""), "dates": dates})
+    with metrics.stage("json"):
+        return jsonify({"title": data.get("title", ""), "dates": dates})
 
 # API: live таблица (для страницы гонки)
 @app.route("/api/live")
 def api_live():
     race = request.args.get("race", "")
     cat = request.args.get("cat", "")
-    data = run_sync(event_svc.fetch_event_data())
+    with metrics.stage("event_data"):
+        data = run_sync(event_svc.fetch_event_data())
     if not data:
         return jsonify({}), 500
 
-    result = run_sync(event_svc.get_live_table(data, race_id=race, cat_filter=cat))
-    return jsonify(result)
+    # протоколы GetResult (из кэша или Ski123) и сборка таблицы
+    with metrics.stage("table"):
+        result = run_sync(event_svc.get_live_table(data, race_id=race, cat_filter=cat))
+    with metrics.stage("json"):
+        return jsonify(result)
 
 if __name__ == "__main__":
     # Запуск: python app.py
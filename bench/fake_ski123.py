@@ -0,0 +1,136 @@
+# bench/fake_ski123.py
+"""
+Эмулятор SOAP-сервиса Ski123 (iInfoInterface) для нагрузочных тестов без сети площадки.
+Отвечает на GetEventData и GetResult по тем же SOAPAction, что soap_client.soap_call
+и ski_sender.soap_call; протоколы растут по мере прохождения отметок.
+
+    python bench/fake_ski123.py --participants 3000 --races 4 --speed 10 --latency 40 --jitter 20
+    SKI123_URL=http://127.0.0.1:8123/Info python app.py
+    SKI123_URL=http://127.0.0.1:8123/Info VPS_URL=http://127.0.0.1:5050/api/push python ski_sender.py
+
+--speed 10 — гоночное время идёт в 10 раз быстрее реального; --error-rate 0.05 —
+5% ответов SOAP Fault (HTTP 500).
+"""
+import argparse
+import asyncio
+import random
+import re
+import time
+
+from aiohttp import web
+
+from payload_gen import SyntheticEvent
+
+ACTION_EVENTDATA = "http://tempuri.org/iInfoInterface/GetEventData"
+ACTION_RESULT = "http://tempuri.org/iInfoInterface/GetResult"
+
+_RACE_ID = re.compile(r"<RaceId>\s*([^<]*?)\s*</RaceId>")
+_RANKING_NR = re.compile(r"<RankingNr>\s*([^<]*?)\s*</RankingNr>")
+
+FAULT = (
+    '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/"><s:Body><s:Fault>'
+    '<faultcode>s:Server</faultcode><faultstring>Эмуляция ошибки сервиса</faultstring>'
+    '</s:Fault></s:Body></s:Envelope>'
+)
+
+
+class FakeSki123:
+    def __init__(self, event, speed=1.0, start_at=0.0, latency=0.0, jitter=0.0, error_rate=0.0, tick=1.0, seed=None):
+        self.event = event
+        self.speed = speed
+        self.start_at = start_at      # сек гоночного времени в момент запуска
+        self.latency = latency        # сек
+        self.jitter = jitter          # сек, равномерно ±
+        self.error_rate = error_rate
+        self.tick = tick              # шаг гоночного времени, с которым пересобираются протоколы
+        self.random = random.Random(seed)
+        self.started = time.monotonic()
+        self.event_xml = event.event_xml()
+        self._results = {}            # (race_id, ranking_nr) -> (tick, xml)
+        self.requests = 0
+        self.errors = 0
+
+    def elapsed(self):
+        """Гоночное время (сек), округлённое до tick; после финиша последнего — None (итог)."""
+        elapsed = self.start_at + (time.monotonic() - self.started) * self.speed
+        if elapsed >= self.event.duration():
+            return None
+        return elapsed - elapsed % self.tick
+
+    def result_xml(self, race_id, ranking_nr):
+        elapsed = self.elapsed()
+        cached = self._results.get((race_id, ranking_nr))
+        if cached is not None and cached[0] == elapsed:
+            return cached[1]
+        xml = self.event.result_xml(race_id, ranking_nr, elapsed)
+        self._results[(race_id, ranking_nr)] = (elapsed, xml)
+        return xml
+
+    async def handle(self, request):
+        self.requests += 1
+        body = await request.text()
+        action = request.headers.get("SOAPAction", "").strip('"')
+
+        delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.random.random() < self.error_rate:
+            self.errors += 1
+            return web.Response(status=500, text=FAULT, content_type="text/xml", charset="utf-8")
+
+        if action == ACTION_EVENTDATA:
+            xml = self.event_xml
+        elif action == ACTION_RESULT:
+            race_id = _RACE_ID.search(body)
+            ranking_nr = _RANKING_NR.search(body)
+            if race_id is None or ranking_nr is None or not ranking_nr.group(1).isdigit():
+                return web.Response(status=400, text=FAULT, content_type="text/xml", charset="utf-8")
+            xml = self.result_xml(race_id.group(1), int(ranking_nr.group(1)))
+        else:
+            return web.Response(status=500, text=FAULT, content_type="text/xml", charset="utf-8")
+        return web.Response(text=xml, content_type="text/xml", charset="utf-8")
+
+    async def handle_status(self, request):
+        elapsed = self.elapsed()
+        return web.json_response({
+            "elapsed": elapsed,
+            "finished": elapsed is None,
+            "requests": self.requests,
+            "errors": self.errors
+        })
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_post("/Info", self.handle)
+        app.router.add_get("/status", self.handle_status)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Эмулятор SOAP-сервиса Ski123")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--participants", type=int, default=1000)
+    parser.add_argument("--races", type=int, default=4)
+    parser.add_argument("--rankings", type=int, default=5, help="отметок на гонку, включая старт и финиш")
+    parser.add_argument("--finish-share", type=float, default=0.9)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--speed", type=float, default=1.0, help="ускорение гоночного времени")
+    parser.add_argument("--start-at", type=float, default=0.0, help="гоночное время при запуске, сек")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, мс")
+    parser.add_argument("--jitter", type=float, default=0.0, help="разброс задержки ±, мс")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов SOAP Fault")
+    parser.add_argument("--tick", type=float, default=1.0, help="шаг гоночного времени для протоколов, сек")
+    args = parser.parse_args()
+
+    event = SyntheticEvent(participants=args.participants, races=args.races, rankings=args.rankings,
+                           finish_share=args.finish_share, seed=args.seed)
+    fake = FakeSki123(event, speed=args.speed, start_at=args.start_at, latency=args.latency / 1000,
+                      jitter=args.jitter / 1000, error_rate=args.error_rate, tick=args.tick, seed=args.seed)
+    print(f"Ski123 emulator: http://{args.host}:{args.port}/Info, "
+          f"{len(event.athletes)} участников, гонка длится {event.duration() / args.speed:.0f} с")
+    web.run_app(fake.make_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
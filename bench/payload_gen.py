@@ -0,0 +1,205 @@
+# bench/payload_gen.py
+"""
+Генератор синтетических SOAP-ответов Ski123 (GetEventData / GetResult)
+в пространстве имён a: = http://schemas.datacontract.org/2004/07/Ski123.
+
+Модель гонки: участники распределены по гонкам, у каждого свой старт
+(раздельный, интервал START_INTERVAL) и темп; отметки проходятся по мере
+течения времени, часть участников сходит с дистанции.
+
+    event = SyntheticEvent(participants=2000, races=4, rankings=5, finish_share=0.9)
+    event.event_xml()                       # GetEventData
+    event.result_xml("2", 3, elapsed=900)   # GetResult на 15-й минуте гонки
+    event.payload()                         # {"event_xml", "results"} как у ski_sender
+"""
+import random
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+
+A_NS = "http://schemas.datacontract.org/2004/07/Ski123"
+START_INTERVAL = 30  # сек между стартами соседних номеров
+
+_FIRST_NAMES = ["Иван", "Пётр", "Алексей", "Сергей", "Дмитрий", "Анна", "Мария", "Елена", "Ольга", "Наталья",
+                "Михаил", "Андрей", "Юлия", "Татьяна", "Никита", "Ксения", "Артём", "Полина", "Егор", "Дарья"]
+_LAST_NAMES = ["Иванов", "Петров", "Смирнов", "Кузнецов", "Попов", "Соколов", "Лебедев", "Козлов", "Новиков",
+               "Морозов", "Волков", "Фёдоров", "Михайлов", "Беляев", "Тарасов", "Белов", "Комаров", "Орлов"]
+_CLUBS = ["СШОР №%d" % i for i in range(1, 31)] + ["Лично", "Динамо", "ЦСКА", "Спартак", "Локомотив"]
+_CATEGORIES = ["M18", "W18", "M21", "W21", "M35", "W35", "M50", "W50", "M65", "W65"]
+
+
+def format_time(seconds):
+    """Формат Ski123: M:SS.s или H:MM:SS.s."""
+    tenths = int(round(seconds * 10))
+    h, rest = divmod(tenths, 36000)
+    m, rest = divmod(rest, 600)
+    s, t = divmod(rest, 10)
+    if h:
+        return f"{h}:{m:02d}:{s:02d}.{t}"
+    return f"{m}:{s:02d}.{t}"
+
+
+def _envelope(response, result, inner):
+    return (
+        '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/"><s:Body>'
+        f'<{response} xmlns="http://tempuri.org/">'
+        f'<{result} xmlns:a="{A_NS}" xmlns:i="http://www.w3.org/2001/XMLSchema-instance">'
+        f'{inner}</{result}></{response}></s:Body></s:Envelope>'
+    )
+
+
+class _Athlete:
+    __slots__ = ("id", "bib", "name", "club", "cat", "start_offset", "splits")
+
+    def __init__(self, id, bib, name, club, cat, start_offset, splits):
+        self.id = id
+        self.bib = bib
+        self.name = name
+        self.club = club
+        self.cat = cat
+        self.start_offset = start_offset  # сек от старта гонки
+        self.splits = splits              # время от собственного старта на каждой отметке; None — не дошёл
+
+
+class SyntheticEvent:
+    """
+    participants — всего участников (делятся между гонками поровну)
+    races        — число гонок в расписании
+    rankings     — отметок на гонку, включая старт (RankingNr 1) и финиш (последний)
+    finish_share — доля участников, дошедших до финиша
+    """
+
+    def __init__(self, participants=500, races=3, rankings=4, finish_share=0.9, seed=1,
+                 start=datetime(2026, 2, 14, 10, 0), course_time=1800.0):
+        self.rankings = max(2, rankings)
+        self.title = "Синтетические соревнования"
+        rnd = random.Random(seed)
+        self.races = []
+        for r in range(races):
+            self.races.append({
+                "RaceId": str(r + 1),
+                "Title": "Гонка %d - %s" % (r + 1, rnd.choice(["5 км", "10 км", "15 км", "30 км"])),
+                "Start": start + timedelta(days=r // 2, hours=3 * (r % 2)),
+                "Athletes": []
+            })
+        # отметки: доли дистанции, последняя — финиш
+        checkpoints = [k / (self.rankings - 1) for k in range(1, self.rankings)]
+        self.athletes = []
+        for i in range(participants):
+            race = self.races[i % races] if races else None
+            if race is None:
+                break
+            order = len(race["Athletes"])
+            pace = course_time * rnd.uniform(0.85, 1.6)
+            reaches = len(checkpoints) if rnd.random() < finish_share else rnd.randrange(0, len(checkpoints))
+            splits = [pace * f * rnd.uniform(0.97, 1.03) if k < reaches else None
+                      for k, f in enumerate(checkpoints)]
+            for k in range(1, len(splits)):
+                if splits[k] is not None and splits[k] <= splits[k - 1]:
+                    splits[k] = splits[k - 1] + 1.0
+            athlete = _Athlete(
+                id=str(1000 + i),
+                bib=str(order + 1),
+                name=f"{rnd.choice(_LAST_NAMES)} {rnd.choice(_FIRST_NAMES)}",
+                club=rnd.choice(_CLUBS),
+                cat=rnd.choice(_CATEGORIES),
+                start_offset=order * START_INTERVAL,
+                splits=splits
+            )
+            race["Athletes"].append(athlete)
+            self.athletes.append(athlete)
+
+    def ranking_title(self, ranking_nr):
+        if ranking_nr == 1:
+            return "Старт"
+        if ranking_nr == self.rankings:
+            return "Финиш"
+        return f"Отметка {ranking_nr - 1}"
+
+    def duration(self):
+        """Сек от старта гонки, когда последний участник прошёл последнюю отметку."""
+        longest = 0.0
+        for a in self.athletes:
+            passed = [s for s in a.splits if s is not None]
+            if passed:
+                longest = max(longest, a.start_offset + passed[-1])
+        return longest
+
+    def event_xml(self):
+        parts = []
+        for a in self.athletes:
+            parts.append(
+                "<a:clsInfoParticipant>"
+                f"<a:Bib>{a.bib}</a:Bib><a:CatId>{escape(a.cat)}</a:CatId><a:ClassId>{escape(a.cat)}</a:ClassId>"
+                f"<a:Club>{escape(a.club)}</a:Club><a:Id>{a.id}</a:Id><a:Name>{escape(a.name)}</a:Name>"
+                "</a:clsInfoParticipant>"
+            )
+        schedule = []
+        for race in self.races:
+            rankings = "".join(
+                "<a:clsInfoRankingDefinition>"
+                f"<a:ProgressTitle>{escape(self.ranking_title(k))}</a:ProgressTitle><a:RankingNr>{k}</a:RankingNr>"
+                "</a:clsInfoRankingDefinition>"
+                for k in range(1, self.rankings + 1)
+            )
+            # как в реальных данных: гонка повторяется по группам, время старта есть не у всех записей
+            for group, with_time in (("Мужчины", True), ("Женщины", False)):
+                start_dt = race["Start"].isoformat() if with_time else ""
+                schedule.append(
+                    "<a:clsInfoScheduledEvent>"
+                    f"<a:RaceId>{race['RaceId']}</a:RaceId>"
+                    f"<a:RaceTitle>{escape(race['Title'])} - {group}</a:RaceTitle>"
+                    f"<a:Rankings>{rankings}</a:Rankings>"
+                    f"<a:StartDateTime>{start_dt}</a:StartDateTime>"
+                    "</a:clsInfoScheduledEvent>"
+                )
+        inner = (f"<a:MainTitle>{escape(self.title)}</a:MainTitle>"
+                 f"<a:Participants>{''.join(parts)}</a:Participants>"
+                 f"<a:Schedule>{''.join(schedule)}</a:Schedule>")
+        return _envelope("GetEventDataResponse", "GetEventDataResult", inner)
+
+    def result_xml(self, race_id, ranking_nr, elapsed=None):
+        """
+        GetResult для отметки ranking_nr. elapsed — сек от старта гонки
+        (None — гонка завершена): в протокол попадают только уже прошедшие отметку.
+        """
+        ranking_nr = int(ranking_nr)
+        race = next((r for r in self.races if r["RaceId"] == str(race_id)), None)
+        rows = []
+        if race is not None and 1 <= ranking_nr <= self.rankings:
+            if ranking_nr == 1:
+                for a in race["Athletes"]:
+                    if elapsed is None or a.start_offset <= elapsed:
+                        start_clock = race["Start"] + timedelta(seconds=a.start_offset)
+                        rows.append(self._row(a, start_clock.strftime("%H:%M:%S"), ""))
+            else:
+                passed = []
+                for a in race["Athletes"]:
+                    split = a.splits[ranking_nr - 2]
+                    if split is not None and (elapsed is None or a.start_offset + split <= elapsed):
+                        passed.append((split, a))
+                passed.sort(key=lambda x: x[0])
+                leader = passed[0][0] if passed else 0.0
+                for split, a in passed:
+                    behind = "" if split == leader else "+" + format_time(split - leader)
+                    rows.append(self._row(a, format_time(split), behind))
+                if ranking_nr == self.rankings and elapsed is None:
+                    # сошедшие в итоговом протоколе — с прочерком
+                    for a in race["Athletes"]:
+                        if a.splits[-1] is None:
+                            rows.append(self._row(a, "-", ""))
+        inner = "<a:Rows>%s</a:Rows>" % "".join(rows)
+        return _envelope("GetResultResponse", "GetResultResult", inner)
+
+    def _row(self, a, result, behind):
+        return ("<a:clsInfoResultRow>"
+                f"<a:Behind>{behind}</a:Behind><a:Bib>{a.bib}</a:Bib><a:Id>{a.id}</a:Id>"
+                f"<a:Name>{escape(a.name)}</a:Name><a:Result>{result}</a:Result>"
+                "</a:clsInfoResultRow>")
+
+    def payload(self, elapsed=None):
+        """Пакет в формате ski_sender: {"event_xml", "results": {"raceid_rank": xml}}."""
+        results = {}
+        for race in self.races:
+            for k in range(1, self.rankings + 1):
+                results[f"{race['RaceId']}_{k}"] = self.result_xml(race["RaceId"], k, elapsed)
+        return {"event_xml": self.event_xml(), "results": results}
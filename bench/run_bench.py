@@ -0,0 +1,208 @@
+# bench/run_bench.py
+"""
+Замеры времени и пиковой памяти по стадиям на синтетических данных (bench/payload_gen.py).
+
+    python bench/run_bench.py
+    python bench/run_bench.py --target vps --sizes 500,5000 --json out.json
+    python bench/run_bench.py --baseline out.json      # код возврата 1 при регрессии
+    python bench/run_bench.py --sizes 5000 --races 1   # таблица на 5000 строк (стадии encode live)
+
+Локальное приложение и VPS используют одноимённый пакет services, поэтому каждая
+цель замеряется в отдельном процессе. SOAP в локальном приложении подменяется
+ответами генератора из памяти — в замер попадает только наша обработка.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from payload_gen import SyntheticEvent
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGET_DIRS = {"local": ROOT, "vps": os.path.join(ROOT, "VPS")}
+DEFAULT_SIZES = "50,500,2000,10000"
+
+
+def measure(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"median_ms": statistics.median(times), "min_ms": min(times), "peak_kb": peak / 1024}
+
+
+def encode_stages(flask_app, table):
+    """JSON-ответ таблицы: стандартный провайдер Flask против FastJSONProvider приложения (app.json)."""
+    from flask.json.provider import DefaultJSONProvider
+    from services import json_codec
+
+    default = DefaultJSONProvider(flask_app)
+    fast = flask_app.json
+    name = "orjson" if json_codec.orjson is not None else "json"
+    return [
+        ("encode live: flask default", lambda: default.response(table).get_data()),
+        (f"encode live: json_codec ({name})", lambda: fast.response(table).get_data()),
+    ]
+
+
+def vps_stages(event, payload, race_id):
+    from services.event_service import EventService
+    import app as vps_app
+
+    svc = EventService()
+    parsed = svc.parse_eventdata_from_payload(payload)
+    snapshot = svc.build_snapshot(payload, 1)
+    client = vps_app.app.test_client()
+    auth = {"Authorization": f"Bearer {vps_app.SECRET_TOKEN}"}
+
+    # два разных пакета по очереди — каждый push меняет данные и строит новый снимок
+    pushes = [event.payload(elapsed=event.duration() / 2), payload]
+
+    def push_changed():
+        pushes.reverse()
+        client.post("/api/push", json=pushes[0], headers=auth)
+
+    client.post("/api/push", json=payload, headers=auth)
+    return [
+        ("parse_eventdata_from_payload", lambda: svc.parse_eventdata_from_payload(payload)),
+        ("group_dates", lambda: svc.group_dates(parsed)),
+        ("build_live_from_payload", lambda: svc.build_live_from_payload(parsed, payload, race_id=race_id)),
+        ("build_snapshot", lambda: svc.build_snapshot(payload, 1)),
+        ("build_live_from_snapshot", lambda: svc.build_live_from_snapshot(snapshot, race_id=race_id)),
+        ("POST /api/push (changed)", push_changed),
+        ("POST /api/push (unchanged)", lambda: client.post("/api/push", json=pushes[0], headers=auth)),
+        ("GET /api/dates", lambda: client.get("/api/dates")),
+        ("GET /api/live", lambda: client.get(f"/api/live?race={race_id}")),
+    ] + encode_stages(vps_app.app, svc.build_live_from_snapshot(snapshot, race_id=race_id))
+
+
+def local_stages(event, payload, race_id):
+    import services.event_service as es
+    import app as local_app
+
+    async def eventdata_raw():
+        return payload["event_xml"]
+
+    async def result_raw(race, ranking_nr):
+        return payload["results"].get(f"{race}_{ranking_nr}")
+
+    es._get_eventdata_raw = eventdata_raw
+    es._get_result_raw = result_raw
+
+    svc = es.EventService()
+    data = svc.parse_event_xml(payload["event_xml"])
+    client = local_app.app.test_client()
+
+    def cold(fn):
+        # пустой кэш SOAP — полный путь запроса
+        def run():
+            es._soap_cache = es.SoapCache()
+            return fn()
+        return run
+
+    client.get(f"/api/live?race={race_id}")
+    return [
+        ("parse_event_xml", lambda: svc.parse_event_xml(payload["event_xml"])),
+        ("get_dates_grouped_by_date", lambda: es.run_sync(svc.get_dates_grouped_by_date(data))),
+        ("get_live_table (cold)", cold(lambda: es.run_sync(svc.get_live_table(data, race_id=race_id)))),
+        ("get_live_table (cached)", lambda: es.run_sync(svc.get_live_table(data, race_id=race_id))),
+        ("GET /api/dates (cold)", cold(lambda: client.get("/api/dates"))),
+        ("GET /api/live (cold)", cold(lambda: client.get(f"/api/live?race={race_id}"))),
+        ("GET /api/live (cached)", lambda: client.get(f"/api/live?race={race_id}")),
+    ] + encode_stages(local_app.app, es.run_sync(svc.get_live_table(data, race_id=race_id)))
+
+
+STAGES = {"local": local_stages, "vps": vps_stages}
+
+
+def run_worker(args):
+    """Замер одной цели в текущем процессе; результат — JSON в stdout."""
+    sys.path.insert(0, TARGET_DIRS[args.worker])
+    # print() из приложения уходит в stderr, чтобы не ломать JSON
+    result_stream, sys.stdout = sys.stdout, sys.stderr
+    out = []
+    for size in args.sizes:
+        event = SyntheticEvent(participants=size, races=args.races, rankings=args.rankings,
+                               finish_share=args.finish_share, seed=args.seed)
+        payload = event.payload()
+        race_id = event.races[0]["RaceId"]
+        for stage, fn in STAGES[args.worker](event, payload, race_id):
+            repeat = args.repeat if size <= 2000 else max(1, args.repeat // 3)
+            out.append(dict(measure(fn, repeat), target=args.worker, size=size, stage=stage))
+    json.dump(out, result_stream)
+
+
+def run_all(args):
+    results = []
+    for target in args.targets:
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker", target,
+               "--sizes", ",".join(map(str, args.sizes)), "--races", str(args.races),
+               "--rankings", str(args.rankings), "--finish-share", str(args.finish_share),
+               "--repeat", str(args.repeat), "--seed", str(args.seed)]
+        proc = subprocess.run(cmd, cwd=TARGET_DIRS[target], stdout=subprocess.PIPE, check=True)
+        results.extend(json.loads(proc.stdout))
+
+    print(f"{'target':6} {'size':>6}  {'stage':36} {'median ms':>10} {'min ms':>10} {'peak MB':>9}")
+    for r in results:
+        print(f"{r['target']:6} {r['size']:>6}  {r['stage']:36} {r['median_ms']:>10.2f} "
+              f"{r['min_ms']:>10.2f} {r['peak_kb'] / 1024:>9.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+
+    if args.baseline:
+        return compare(results, args.baseline, args.tolerance)
+    return 0
+
+
+def compare(results, baseline_path, tolerance):
+    """Сравнение min_ms с прошлым прогоном: 1, если какая-то стадия медленнее более чем на tolerance."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["target"], r["size"], r["stage"]): r for r in json.load(f)}
+    regressions = 0
+    for r in results:
+        old = baseline.get((r["target"], r["size"], r["stage"]))
+        if old and r["min_ms"] > old["min_ms"] * (1 + tolerance):
+            regressions += 1
+            print(f"REGRESSION {r['target']} {r['size']} {r['stage']}: "
+                  f"{old['min_ms']:.2f} -> {r['min_ms']:.2f} ms")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк разбора и построения таблиц Ski123")
+    parser.add_argument("--target", choices=["local", "vps", "both"], default="both")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="число участников, через запятую")
+    parser.add_argument("--races", type=int, default=4)
+    parser.add_argument("--rankings", type=int, default=5, help="отметок на гонку, включая старт и финиш")
+    parser.add_argument("--finish-share", type=float, default=0.9)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для поиска регрессий")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--worker", choices=list(TARGET_DIRS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.sizes = [int(s) for s in args.sizes.split(",") if s]
+    args.targets = ["local", "vps"] if args.target == "both" else [args.target]
+
+    if args.worker:
+        run_worker(args)
+        return 0
+    return run_all(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
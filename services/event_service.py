@@ -1,9 +1,16 @@
 # services/event_service.py
 import asyncio
+import atexit
+import concurrent.futures
+import contextvars
+import threading
+import time
 import xml.etree.ElementTree as ET
+from array import array
 from datetime import datetime
-from services.soap_client import soap_call
-import aiohttp
+from services import xml_parser, metrics, profiling
+from services.result_table import ResultTable, bib_key, order_by_time, gaps_to_leader
+from services.soap_client import soap_call, get_session, close_session
 
 # XML namespaces (как в оригинале)
 NS = {
@@ -13,21 +20,59 @@ NS = {
 }
 
 
-def run_sync(coro):
-    """Запуск async-корутин из синхронного кода."""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop():
+    """Долгоживущий event loop в отдельном потоке — один на процесс."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="soap-loop", daemon=True).start()
+            atexit.register(_shutdown_loop)
+        return _loop
+
+
+def _shutdown_loop():
     try:
-        return loop.run_until_complete(coro)
-    finally:
-        loop.close()
+        asyncio.run_coroutine_threadsafe(close_session(), _loop).result(timeout=2)
+    except Exception:
+        pass
+    _loop.call_soon_threadsafe(_loop.stop)
+
+
+def run_sync(coro):
+    """
+    Запуск async-корутин из синхронного кода (на общем фоновом loop).
+    Корутина выполняется в копии контекста вызывающего потока — профилирование
+    по ?profile= и этапы Server-Timing запроса действуют и внутри неё.
+    """
+    loop = _background_loop()
+    future = concurrent.futures.Future()
+
+    def start():
+        # задача наследует контекст, в котором вызван start
+        loop.create_task(coro).add_done_callback(lambda task: _copy_outcome(task, future))
+
+    loop.call_soon_threadsafe(start, context=contextvars.copy_context())
+    return future.result()
+
+
+def _copy_outcome(task, future):
+    if task.cancelled():
+        future.cancel()
+    elif task.exception() is not None:
+        future.set_exception(task.exception())
+    else:
+        future.set_result(task.result())
 
 
 async def _get_eventdata_raw():
     """Возвращает сырый XML GetEventData (строка) или None."""
-    async with aiohttp.ClientSession() as session:
-        return await soap_call(session, "http://tempuri.org/iInfoInterface/GetEventData",
-                               "<GetEventData xmlns='http://tempuri.org/'/>")
+    return await soap_call(await get_session(), "http://tempuri.org/iInfoInterface/GetEventData",
+                           "<GetEventData xmlns='http://tempuri.org/'/>")
 
 
 async def _get_result_raw(race_id: str, ranking_nr: int):
@@ -40,8 +85,89 @@ async def _get_result_raw(race_id: str, ranking_nr: int):
         <AttId></AttId>
     </GetResult>
     """
-    async with aiohttp.ClientSession() as session:
-        return await soap_call(session, "http://tempuri.org/iInfoInterface/GetResult", body)
+    return await soap_call(await get_session(), "http://tempuri.org/iInfoInterface/GetResult", body)
+
+
+# Время жизни кэша по SOAP-действиям (сек)
+EVENTDATA_TTL = 60  # заголовок, участники и расписание меняются редко
+RESULT_TTL = 2      # протоколы обновляются постоянно
+
+_inflight = {}
+
+
+async def _single_flight(key, factory):
+    """
+    Одинаковые одновременные upstream-вызовы (по key) выполняются один раз:
+    остальные ждут тот же Task. Работает без блокировок — все вызовы идут
+    в одном фоновом loop.
+    """
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # shield: отмена одного ожидающего не отменяет запрос для остальных
+    return await asyncio.shield(task)
+
+
+class SoapCache:
+    """
+    TTL-кэш ответов SOAP со stale-while-revalidate.
+    Свежая запись отдаётся сразу; устаревшая тоже отдаётся сразу, а обновление
+    идёт в фоне. Если upstream вернул None (ошибка) — остаётся последнее удачное значение.
+    Используется только из фонового loop, поэтому без блокировок.
+    """
+
+    def __init__(self):
+        self._entries = {}     # key -> (value, fetched_at)
+        self._refreshing = {}  # key -> Task фонового обновления
+
+    async def get(self, key, ttl, load):
+        entry = self._entries.get(key)
+        if entry is None:
+            # первый запрос — ждём upstream
+            return await self._load(key, load)
+        value, fetched_at = entry
+        if time.monotonic() - fetched_at >= ttl and key not in self._refreshing:
+            task = asyncio.ensure_future(self._load(key, load))
+            self._refreshing[key] = task
+            task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+        return value
+
+    async def _load(self, key, load):
+        value = await _single_flight(key, load)
+        if value is not None:
+            self._entries[key] = (value, time.monotonic())
+            return value
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+
+_soap_cache = SoapCache()
+
+
+async def _get_result_cached(race_id: str, ranking_nr):
+    """ResultTable протокола (в кэше лежит уже разобранный) или None, если данных нет."""
+    return await _soap_cache.get(("GetResult", race_id, str(ranking_nr)), RESULT_TTL,
+                                 lambda: _load_result_table(race_id, ranking_nr))
+
+
+async def _load_result_table(race_id: str, ranking_nr):
+    """
+    Запрос GetResult и разбор в колонки: строки времени переводятся в секунды
+    один раз на ответ upstream, а не на каждый запрос таблицы.
+    """
+    xml = await _get_result_raw(race_id, ranking_nr)
+    if not xml:
+        return None
+    try:
+        with metrics.stage("parse"):
+            rows = xml_parser.parse_result_rows(xml)
+    except ET.ParseError as e:
+        print("parse result_xml:", e)
+        metrics.ERRORS.inc("parse")
+        rows = None
+    return ResultTable(rows or (), _time_to_seconds)
 
 
 def _time_to_seconds(t: str):
@@ -76,66 +202,28 @@ class EventService:
         Возвращает dict:
           {
             title: str,
-            participants: {Id: {Name, Club, CatId, ClassId}},
+            participants: {Id: Participant(Name, Club, CatId, ClassId)},
             schedule: [{RaceId, RaceTitle, Rankings: [{RankingNr, ProgressTitle}], StartDateTime}]
           }
         """
+        return await _soap_cache.get(("GetEventData",), EVENTDATA_TTL, self._load_event_data)
+
+    async def _load_event_data(self):
         xml = await _get_eventdata_raw()
+        return self.parse_event_xml(xml)
+
+    def parse_event_xml(self, xml):
+        """Разбор сырого XML GetEventData в dict fetch_event_data (или None)."""
         if not xml:
             return None
         try:
-            root = ET.fromstring(xml)
-        except Exception as e:
+            with metrics.stage("parse"):
+                return xml_parser.parse_event_xml(xml)
+        except ET.ParseError as e:
             print("Parse event_xml error:", e)
+            metrics.ERRORS.inc("parse")
             return None
 
-        result = root.find('.//temp:GetEventDataResult', self.NS)
-        if result is None:
-            return None
-
-        title = result.findtext('a:MainTitle', default="", namespaces=self.NS)
-
-        participants = {}
-        for p in result.findall('.//a:clsInfoParticipant', self.NS):
-            pid = p.findtext('a:Id', default="", namespaces=self.NS)
-            participants[pid] = {
-                "Name": p.findtext('a:Name', default="", namespaces=self.NS),
-                "Club": p.findtext('a:Club', default="", namespaces=self.NS),
-                "CatId": p.findtext('a:CatId', default="", namespaces=self.NS),
-                "ClassId": p.findtext('a:ClassId', default="", namespaces=self.NS)
-            }
-
-        # schedule: группируем по RaceId, убираем дубли (группы)
-        schedule_dict = {}
-        for s in result.findall('.//a:clsInfoScheduledEvent', self.NS):
-            race_id = s.findtext('a:RaceId', default="", namespaces=self.NS)
-            race_title = s.findtext('a:RaceTitle', default="", namespaces=self.NS)
-            start_dt = s.findtext('a:StartDateTime', default="", namespaces=self.NS) or ""
-
-            clean_title = race_title.split("-")[0].strip()
-
-            rankings = []
-            for r in s.findall('.//a:clsInfoRankingDefinition', self.NS):
-                rankings.append({
-                    "RankingNr": r.findtext('a:RankingNr', default="", namespaces=self.NS),
-                    "ProgressTitle": r.findtext('a:ProgressTitle', default="", namespaces=self.NS)
-                })
-
-            if race_id not in schedule_dict:
-                schedule_dict[race_id] = {
-                    "RaceId": race_id,
-                    "RaceTitle": clean_title,
-                    "Rankings": rankings,
-                    "StartDateTime": start_dt
-                }
-            else:
-                # если уже есть запись, но нет StartDateTime — попробуем заполнить
-                if not schedule_dict[race_id].get("StartDateTime") and start_dt:
-                    schedule_dict[race_id]["StartDateTime"] = start_dt
-
-        schedule = list(schedule_dict.values())
-        return {"title": title, "participants": participants, "schedule": schedule}
-
     async def get_dates_grouped_by_date(self, data):
         """Группировка гонок по дате (YYYY-MM-DD)."""
         schedule = data.get("schedule", [])
@@ -179,6 +267,7 @@ class EventService:
                     pass
             return "Без даты"
 
+    @profiling.profiled("get_live_table")
     async def get_live_table(self, data, race_id: str = "", cat_filter: str = ""):
         """
         Формирует таблицу результатов для гонки.
@@ -197,67 +286,48 @@ class EventService:
         table = {}
         headers = []
 
-        # --- Старт (RankingNr = 1) ---
-        start_xml = await _get_result_raw(race_id, 1)
-        if start_xml:
+        # --- Все протоколы гонки запрашиваем одновременно ---
+        rankings = [rank for rank in race.get("Rankings", []) if rank["RankingNr"] != "1"]
+        ranking_nrs = []
+        for rank in rankings:
+            # RankingNr может приходить как строка; приводим к int для _get_result_raw
             try:
-                root2 = ET.fromstring(start_xml)
-                result2 = root2.find('.//temp:GetResultResult', self.NS)
-                if result2 is not None:
-                    for r in result2.findall('.//a:clsInfoResultRow', self.NS):
-                        bib = r.findtext('a:Bib', default="-", namespaces=self.NS)
-                        athlete_id = r.findtext('a:Id', default="", namespaces=self.NS)
-                        start_time = r.findtext('a:Result', default="", namespaces=self.NS)
-                        pinfo = participants.get(athlete_id, {})
-                        table[bib] = {
-                            "Bib": bib,
-                            "Name": pinfo.get("Name", athlete_id),
-                            "Club": pinfo.get("Club", ""),
-                            "CatId": pinfo.get("CatId", ""),
-                            "Start": start_time
-                        }
-            except Exception as e:
-                print("parse start_xml:", e)
+                ranking_nrs.append(int(rank["RankingNr"]))
+            except:
+                ranking_nrs.append(rank["RankingNr"])
+        start_table, *result_tables = await asyncio.gather(
+            _get_result_cached(race_id, 1),
+            *(_get_result_cached(race_id, nr) for nr in ranking_nrs)
+        )
+
+        # --- Старт (RankingNr = 1) ---
+        for bib, athlete_id, start_time in start_table or ():
+            pinfo = participants.get(athlete_id, {})
+            table[bib] = {
+                "Bib": bib,
+                "Name": pinfo.get("Name", athlete_id),
+                "Club": pinfo.get("Club", ""),
+                "CatId": pinfo.get("CatId", ""),
+                "Start": start_time if start_time is not None else ""
+            }
 
         headers.append("Start")
         finish_column = None
+        finish_seconds = {}  # bib -> секунды финиша из колонки ResultTable.seconds
 
         # --- Остальные этапы ---
-        for rank in race.get("Rankings", []):
-            if rank["RankingNr"] == "1":
-                continue
-            # RankingNr может приходить как строка; приводим к int для _get_result_raw
-            try:
-                ranking_nr = int(rank["RankingNr"])
-            except:
-                # если не удалось - пропускаем
-                ranking_nr = rank["RankingNr"]
-
+        for rank, result_table in zip(rankings, result_tables):
             title_rank = rank["ProgressTitle"]
-            result_xml = await _get_result_raw(race_id, ranking_nr)
-            if not result_xml:
-                headers.append(title_rank)
-                continue
-            try:
-                root3 = ET.fromstring(result_xml)
-                result3 = root3.find('.//temp:GetResultResult', self.NS)
-            except Exception as e:
-                print("parse result_xml:", e)
-                result3 = None
-
             headers.append(title_rank)
-            if "ФИНИШ" in (title_rank or "").upper():
-                finish_column = title_rank
-
-            if result3 is None:
+            if result_table is None:
                 continue
 
-            for r in result3.findall('.//a:clsInfoResultRow', self.NS):
-                bib = r.findtext('a:Bib', default="-", namespaces=self.NS)
-                value = r.findtext('a:Result', default="-", namespaces=self.NS)
-                behind = r.findtext('a:Behind', default="", namespaces=self.NS)
-                athlete_id = r.findtext('a:Id', default="", namespaces=self.NS)
+            is_finish = "ФИНИШ" in (title_rank or "").upper()
+            if is_finish:
+                finish_column = title_rank
+                finish_seconds = dict(zip(result_table.bibs, result_table.seconds))
 
+            for bib, athlete_id, value in result_table:
                 if bib not in table:
                     pinfo = participants.get(athlete_id, {})
                     table[bib] = {
@@ -268,11 +338,7 @@ class EventService:
                         "Start": ""
                     }
 
-                table[bib][title_rank] = value
-
-                # Отставание берём и заполняем только по финишу (далее будет перерасчёт)
-                if "ФИНИШ" in (title_rank or "").upper():
-                    table[bib]["Отставание_raw"] = behind  # временное поле, перезапишем ниже
+                table[bib][title_rank] = value if value is not None else "-"
 
         rows_all = list(table.values())
 
@@ -285,11 +351,16 @@ class EventService:
         # --- СОРТИРОВКА и РАСЧЁТ МЕСТ/ОТСТАВАНИЯ ---
         if finish_column:
             # Отдельно финишировавшие и НЕ финишировавшие внутри уже отфильтрованного набора rows
-            finished = [r for r in rows if r.get(finish_column) and r.get(finish_column) != "-"]
+            # равное время — по номеру: порядок не зависит от стартового протокола
+            finished = sorted((r for r in rows if r.get(finish_column) and r.get(finish_column) != "-"),
+                              key=lambda r: bib_key(r["Bib"]))
             not_finished = [r for r in rows if not r.get(finish_column) or r.get(finish_column) == "-"]
 
-            # Сортируем финишировавших по времени (меньше — лучше)
-            finished.sort(key=lambda x: _time_to_seconds(x.get(finish_column)))
+            # Сортируем финишировавших по времени (меньше — лучше), время уже в секундах
+            seconds = array("d", [finish_seconds[r["Bib"]] for r in finished])
+            order = order_by_time(seconds)
+            finished = [finished[i] for i in order]
+            times = [seconds[i] for i in order]
 
             # Нефинишировавшие — по bib
             not_finished.sort(key=lambda x: int(x.get("Bib", 9999)))
@@ -297,17 +368,16 @@ class EventService:
             # Лидер считается в рамках выбранной категории (finished уже отфильтрованы)
             leader_time = None
             if finished:
-                leader_time = _time_to_seconds(finished[0].get(finish_column))
+                leader_time = times[0]
+                times = gaps_to_leader(times, leader_time)
 
             # Проставляем места и пересчитываем отставание относительно leader_time
             place = 1
-            for r in finished:
+            for r, diff in zip(finished, times):
                 r["Место"] = place
                 place += 1
 
                 if leader_time is not None:
-                    cur_time = _time_to_seconds(r.get(finish_column))
-                    diff = cur_time - leader_time
                     if diff <= 0.0001:
                         r["Отставание"] = ""  # лидер — пустое отставание
                     else:
@@ -318,16 +388,11 @@ class EventService:
                         r["Отставание"] = f"+{minutes}:{seconds:05.2f}"
                 else:
                     r["Отставание"] = ""
-                # удалим временное поле, если было
-                if "Отставание_raw" in r:
-                    del r["Отставание_raw"]
 
             # у не финишировавших места и отставание пустые
             for r in not_finished:
                 r["Место"] = ""
                 r["Отставание"] = ""
-                if "Отставание_raw" in r:
-                    del r["Отставание_raw"]
 
             rows = finished + not_finished
         else:
@@ -0,0 +1,18 @@
+# services/json_codec.py
+import json
+
+try:
+    import orjson
+except ImportError:  # необязательная зависимость — без неё кодирует стандартный json
+    orjson = None
+
+
+def dumps(obj, default=None):
+    """
+    JSON сразу в bytes (utf-8), компактно и без \\uXXXX-экранирования кириллицы.
+    orjson, если установлен, иначе json из стандартной библиотеки.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=default)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=default).encode("utf-8")
+
@@ -0,0 +1,167 @@
+# services/metrics.py
+"""
+Метрики в текстовом формате Prometheus (GET /metrics) — без внешних зависимостей.
+Счётчики и гистограммы регистрируются при создании и живут весь процесс;
+при нескольких воркерах gunicorn каждый воркер отдаёт свои значения.
+
+stage(name) — замер этапа обработки запроса: попадает в гистограмму STAGE_SECONDS
+и в заголовок Server-Timing ответа (start_request/finish_request в обработчиках app).
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Границы гистограмм по умолчанию (сек): от долей миллисекунды до десятков секунд
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+_registry = []
+_INF = 'le="+Inf"'
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """Счётчик: inc(*значения меток, amount=1)."""
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    """Гистограмма: observe(value, *значения меток); time(*метки) — замер блока в секундах."""
+
+    def __init__(self, name, help, labelnames=(), buckets=TIME_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}  # метки -> [счётчики по корзинам..., сумма, количество]
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            data = self._values.get(labels)
+            if data is None:
+                data = self._values[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+                    break
+            data[-2] += value
+            data[-1] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(data)) for labels, data in self._values.items())
+        for labels, data in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, _INF)} {data[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(data[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {data[-1]}")
+        return lines
+
+
+def render():
+    """Все метрики процесса в текстовом формате Prometheus (bytes)."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = Histogram("ski_stage_seconds", "Длительность этапов обработки (parse, table, json, ...)", ("stage",))
+REQUEST_SECONDS = Histogram("ski_http_request_seconds", "Время обработки HTTP-запроса", ("endpoint",))
+RESPONSES = Counter("ski_http_responses_total", "HTTP-ответы по маршруту и коду (200, 304, ...)",
+                    ("endpoint", "code"))
+ERRORS = Counter("ski_errors_total", "Ошибки по виду (soap, parse)", ("kind",))
+
+# текущий запрос: (время начала, {этап: секунды}); None — вне запроса (фоновые потоки)
+_request = ContextVar("ski_request", default=None)
+
+
+@contextmanager
+def stage(name):
+    """Замер этапа: в STAGE_SECONDS и, внутри запроса, в его Server-Timing."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, name)
+        current = _request.get()
+        if current is not None:
+            timings = current[1]
+            # этап, пройденный несколько раз (разбор протоколов пакета), суммируется
+            timings[name] = timings.get(name, 0) + elapsed
+
+
+def start_request():
+    """Начало запроса: с этого момента этапы stage() собираются для его Server-Timing."""
+    _request.set((time.perf_counter(), {}))
+
+
+def finish_request(endpoint, code):
+    """Учесть ответ в REQUEST_SECONDS/RESPONSES; возвращает значение заголовка Server-Timing."""
+    current = _request.get()
+    if current is None:
+        return ""
+    _request.set(None)
+    start, timings = current
+    total = time.perf_counter() - start
+    REQUEST_SECONDS.observe(total, endpoint)
+    RESPONSES.inc(endpoint, str(code))
+    # фоновые задачи, запущенные запросом на loop (обновление кэша SOAP), могут ещё дописывать этапы
+    parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.copy().items()]
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
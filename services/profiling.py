@@ -0,0 +1,141 @@
+# services/profiling.py
+"""
+Профилирование горячего пути (/api/live, get_live_table) прямо в продакшне — по включению.
+
+  PROFILE_DIR   — каталог для профилей; не задан — профилирование выключено целиком:
+                  profiled() возвращает функцию как есть, накладных расходов нет
+  PROFILE_RATE  — доля вызовов, профилируемых сами по себе (0.01 — каждый сотый; по умолчанию 0)
+  PROFILE_TOKEN — ?profile=<токен> в запросе профилирует этот запрос; пусто — параметр не действует
+
+Профили каждой функции суммируются и пишутся в PROFILE_DIR/<имя>.<pid>.prof (формат pstats):
+    python -m pstats get_live_table.1234.prof
+    snakeviz get_live_table.1234.prof
+"""
+import atexit
+import cProfile
+import functools
+import hmac
+import inspect
+import os
+import pstats
+import random
+import threading
+from contextvars import ContextVar
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "")
+PROFILE_RATE = float(os.environ.get("PROFILE_RATE", "0") or 0)
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+ENABLED = bool(PROFILE_DIR)
+
+# Сколько профилированных вызовов копить между записями файла
+DUMP_EVERY = 20
+
+# запрос с верным ?profile= — профилируются все обёрнутые вызовы внутри него
+_requested = ContextVar("ski_profile_requested", default=False)
+# Профилируется один вызов на процесс: с Python 3.12 cProfile работает через sys.monitoring —
+# общий для всех потоков, и второй enable() даёт ValueError. Обёрнутые вызовы внутри
+# профилируемого (и в других потоках, пока он идёт) выполняются без профиля
+_busy = threading.Lock()
+
+
+def start_request(token):
+    """Начало запроса: token — значение ?profile= (сравнивается с PROFILE_TOKEN)."""
+    _requested.set(bool(PROFILE_TOKEN) and hmac.compare_digest(token.encode("utf-8"), PROFILE_TOKEN.encode("utf-8")))
+
+
+class _Aggregate:
+    """Сумма профилей одной функции, периодически сбрасываемая на диск."""
+
+    def __init__(self, name):
+        self.path = os.path.join(PROFILE_DIR, f"{name}.{os.getpid()}.prof")
+        self.lock = threading.Lock()
+        self.stats = None
+        self.pending = 0
+        # иначе при остановке процесса пропали бы до DUMP_EVERY - 1 последних профилей
+        atexit.register(self.flush)
+
+    def add(self, profile, force_dump):
+        with self.lock:
+            if self.stats is None:
+                self.stats = pstats.Stats(profile)
+            else:
+                self.stats.add(profile)
+            self.pending += 1
+            # запрошенный вручную профиль пишем сразу — его ждут
+            if force_dump or self.pending >= DUMP_EVERY:
+                self._dump()
+
+    def flush(self):
+        """Записать профили, накопленные после последней записи."""
+        with self.lock:
+            if self.pending:
+                self._dump()
+
+    def _dump(self):
+        self.pending = 0
+        tmp_path = self.path + ".tmp"
+        self.stats.dump_stats(tmp_path)
+        os.replace(tmp_path, self.path)
+
+
+def _should_profile():
+    requested = _requested.get()
+    return requested or (PROFILE_RATE > 0 and random.random() < PROFILE_RATE), requested
+
+
+def _start():
+    """Включённый cProfile.Profile или None — профилировщик уже занят."""
+    if not _busy.acquire(blocking=False):
+        return None
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # профилирует что-то другое (python -m cProfile, отладчик, sys.monitoring)
+        _busy.release()
+        return None
+    return profile
+
+
+def _stop(profile):
+    profile.disable()
+    _busy.release()
+
+
+def profiled(name):
+    """Декоратор: профилировать долю PROFILE_RATE вызовов (и запросы с ?profile=) под именем name."""
+    def decorate(func):
+        if not ENABLED:
+            return func
+        os.makedirs(PROFILE_DIR, mode=0o700, exist_ok=True)
+        aggregate = _Aggregate(name)
+
+        if inspect.iscoroutinefunction(func):
+            # профилировщик привязан к потоку: пока корутина ждёт, в профиль попадает
+            # и остальная работа event loop
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                run, requested = _should_profile()
+                profile = _start() if run else None
+                if profile is None:
+                    return await func(*args, **kwargs)
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    _stop(profile)
+                    aggregate.add(profile, requested)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            run, requested = _should_profile()
+            profile = _start() if run else None
+            if profile is None:
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _stop(profile)
+                aggregate.add(profile, requested)
+        return wrapper
+    return decorate
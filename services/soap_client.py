@@ -1,13 +1,43 @@
 # services/soap_client.py
+import os
+import time
 import aiohttp
 
-# Конфиг — поменяй SOAP_URL если нужно
-SOAP_URL = "http://10.3.226.131/Info"
+from services import metrics
+
+# Конфиг — поменяй SOAP_URL если нужно (или SKI123_URL в окружении, например для bench/fake_ski123.py)
+SOAP_URL = os.environ.get("SKI123_URL", "http://10.3.226.131/Info")
 HEADERS = {
     "Content-Type": "text/xml; charset=utf-8",
     "SOAPAction": ""
 }
 TIMEOUT = 7
+POOL_SIZE = 16         # одновременных соединений к Ski123
+KEEPALIVE_TIMEOUT = 60  # сек держим простаивающее соединение открытым
+
+_session = None
+
+SOAP_SECONDS = metrics.Histogram("ski_soap_seconds", "Длительность SOAP-вызова Ski123", ("action",))
+
+
+async def get_session() -> aiohttp.ClientSession:
+    """
+    Общая ClientSession с пулом keep-alive соединений.
+    Создаётся лениво в фоновом event loop (см. run_sync) и живёт весь процесс.
+    """
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=POOL_SIZE, keepalive_timeout=KEEPALIVE_TIMEOUT)
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
 
 async def soap_call(session: aiohttp.ClientSession, action: str, body: str) -> str | None:
     headers = HEADERS.copy()
@@ -18,10 +48,20 @@ async def soap_call(session: aiohttp.ClientSession, action: str, body: str) -> s
         {body}
       </soap:Body>
     </soap:Envelope>"""
+    name = action.rsplit("/", 1)[-1]  # GetResult, GetEventData
+    start = time.perf_counter()
     try:
         async with session.post(SOAP_URL, data=envelope.encode("utf-8"), headers=headers, timeout=TIMEOUT) as resp:
+            if resp.status >= 400:
+                # SOAP Fault приходит с HTTP 500 — считаем это ошибкой, а не данными
+                print("SOAP ERROR:", resp.status, action)
+                metrics.ERRORS.inc("soap")
+                return None
             return await resp.text()
     except Exception as e:
         # Логирование минимальное — при необходимости расширим
         print("SOAP ERROR:", e)
+        metrics.ERRORS.inc("soap")
         return None
+    finally:
+        SOAP_SECONDS.observe(time.perf_counter() - start, name)
@@ -0,0 +1,207 @@
+# services/xml_parser.py
+import io
+import os
+import xml.etree.ElementTree as ET
+from sys import intern
+
+# Полные имена тегов собраны заранее: при разборе сравниваем строки,
+# без разрешения префикса 'a:' на каждом findtext
+_A = "{http://schemas.datacontract.org/2004/07/Ski123}"
+_TEMP = "{http://tempuri.org/}"
+
+EVENTDATA_RESULT = _TEMP + "GetEventDataResult"
+RESULT_RESULT = _TEMP + "GetResultResult"
+MAIN_TITLE = _A + "MainTitle"
+PARTICIPANT = _A + "clsInfoParticipant"
+SCHEDULED_EVENT = _A + "clsInfoScheduledEvent"
+RANKING_DEFINITION = _A + "clsInfoRankingDefinition"
+RESULT_ROW = _A + "clsInfoResultRow"
+
+_PARTICIPANT_FIELDS = {_A + f: f for f in ("Id", "Name", "Club", "CatId", "ClassId")}
+_EVENT_FIELDS = {_A + f: f for f in ("RaceId", "RaceTitle", "StartDateTime")}
+_RANKING_FIELDS = {_A + f: f for f in ("RankingNr", "ProgressTitle")}
+_ROW_FIELDS = {_A + f: f for f in ("Bib", "Id", "Result", "Behind")}
+
+
+class Participant:
+    """
+    Участник из GetEventData. Запись на __slots__ вместо dict, а клуб, категория
+    и класс — общие (intern) строки: у тысяч участников их всего несколько десятков.
+    get() оставлен для кода, который обращался к участнику как к dict.
+    """
+    __slots__ = ("Name", "Club", "CatId", "ClassId")
+
+    def __init__(self, name, club, cat_id, class_id):
+        self.Name = name
+        self.Club = intern(club)
+        self.CatId = intern(cat_id)
+        self.ClassId = intern(class_id)
+
+    def get(self, field, default=None):
+        return getattr(self, field, default)
+
+
+class StdlibBackend:
+    """
+    xml.etree (C-ускоритель из стандартной библиотеки) — есть всегда.
+    Потоковый iterparse: записи очищаются сразу после разбора.
+    """
+    name = "stdlib"
+    errors = ()  # ET.ParseError и так наш тип ошибки
+
+    def records(self, data, tags, result_tag):
+        """
+        Элементы с тегами tags в порядке документа, последним — result_tag.
+        Если result_tag в документе нет — последним ничего не отдаётся.
+        """
+        for _, elem in ET.iterparse(io.BytesIO(data), events=("end",)):
+            tag = elem.tag
+            if tag == result_tag:
+                yield elem
+                return
+            if tag in tags:
+                yield elem
+
+    def release(self, elem):
+        elem.clear()
+
+
+class LxmlBackend:
+    """
+    lxml: документ целиком разбирается C-парсером (вдвое быстрее ET),
+    записи выбираются через iter(*tags) внутри элемента результата.
+    """
+    name = "lxml"
+
+    def __init__(self):
+        from lxml import etree
+        self._etree = etree
+        self.errors = (etree.Error,)
+
+    def records(self, data, tags, result_tag):
+        # парсер lxml не потокобезопасен — создаём на каждый вызов (это дёшево)
+        parser = self._etree.XMLParser(resolve_entities=False, huge_tree=True)
+        root = self._etree.fromstring(data, parser)
+        result = root if root.tag == result_tag else next(root.iter(result_tag), None)
+        if result is None:
+            return
+        yield from result.iter(*tags)
+        yield result
+
+    def release(self, elem):
+        # дерево освобождается целиком после разбора
+        pass
+
+
+def get_backend(name=None):
+    """
+    Бэкенд разбора: name или переменная окружения SKI123_XML_BACKEND ("lxml"/"stdlib").
+    По умолчанию lxml, если он установлен, иначе stdlib.
+    """
+    name = name or os.environ.get("SKI123_XML_BACKEND", "")
+    if name == "stdlib":
+        return StdlibBackend()
+    try:
+        return LxmlBackend()
+    except ImportError:
+        if name == "lxml":
+            raise
+        return StdlibBackend()
+
+
+default_backend = get_backend()
+
+
+def _as_bytes(xml):
+    return xml.encode("utf-8") if isinstance(xml, str) else xml
+
+
+def _children_text(elem, fields):
+    """Текст прямых потомков по карте {полный тег: имя}; как findtext — берётся первый."""
+    out = {}
+    for child in elem:
+        name = fields.get(child.tag)
+        if name is not None and name not in out:
+            out[name] = child.text or ""
+    return out
+
+
+def parse_event_xml(xml, backend=None):
+    """
+    Разбор ответа GetEventData за один проход iterparse.
+    Возвращает {title, participants: {Id: Participant}, schedule} (schedule уникален по RaceId)
+    или None, если в ответе нет GetEventDataResult.
+    Ошибки XML любого бэкенда поднимаются как ET.ParseError.
+    """
+    backend = backend or default_backend
+    try:
+        return _parse_event_xml(xml, backend)
+    except backend.errors as e:
+        raise ET.ParseError(str(e)) from e
+
+
+def _parse_event_xml(xml, backend):
+    participants = {}
+    schedule_dict = {}
+
+    tags = (PARTICIPANT, SCHEDULED_EVENT)
+    for elem in backend.records(_as_bytes(xml), tags, EVENTDATA_RESULT):
+        tag = elem.tag
+        if tag == PARTICIPANT:
+            f = _children_text(elem, _PARTICIPANT_FIELDS)
+            participants[intern(f.get("Id", ""))] = Participant(
+                f.get("Name", ""), f.get("Club", ""), f.get("CatId", ""), f.get("ClassId", "")
+            )
+            backend.release(elem)
+        elif tag == SCHEDULED_EVENT:
+            f = _children_text(elem, _EVENT_FIELDS)
+            race_id = f.get("RaceId", "")
+            start_dt = f.get("StartDateTime", "")
+            if race_id not in schedule_dict:
+                rankings = []
+                for r in elem.iter(RANKING_DEFINITION):
+                    rf = _children_text(r, _RANKING_FIELDS)
+                    rankings.append({
+                        "RankingNr": rf.get("RankingNr", ""),
+                        "ProgressTitle": rf.get("ProgressTitle", "")
+                    })
+                schedule_dict[race_id] = {
+                    "RaceId": race_id,
+                    "RaceTitle": f.get("RaceTitle", "").split("-")[0].strip(),
+                    "Rankings": rankings,
+                    "StartDateTime": start_dt
+                }
+            elif not schedule_dict[race_id]["StartDateTime"] and start_dt:
+                # дубль гонки (другая группа) — дополним время старта, если его не было
+                schedule_dict[race_id]["StartDateTime"] = start_dt
+            backend.release(elem)
+        elif tag == EVENTDATA_RESULT:
+            title = elem.findtext(MAIN_TITLE, default="")
+            return {"title": title, "participants": participants, "schedule": list(schedule_dict.values())}
+    return None
+
+
+def parse_result_rows(xml, backend=None):
+    """
+    Разбор ответа GetResult за один проход iterparse.
+    Возвращает кортеж строк (Bib, Id, Result, Behind); отсутствующие Result/Behind — None,
+    отсутствующий Bib — "-". None — если в ответе нет GetResultResult.
+    """
+    backend = backend or default_backend
+    try:
+        return _parse_result_rows(xml, backend)
+    except backend.errors as e:
+        raise ET.ParseError(str(e)) from e
+
+
+def _parse_result_rows(xml, backend):
+    rows = []
+    for elem in backend.records(_as_bytes(xml), (RESULT_ROW,), RESULT_RESULT):
+        tag = elem.tag
+        if tag == RESULT_ROW:
+            f = _children_text(elem, _ROW_FIELDS)
+            rows.append((f.get("Bib", "-"), f.get("Id", ""), f.get("Result"), f.get("Behind")))
+            backend.release(elem)
+        elif tag == RESULT_RESULT:
+            return tuple(rows)
+    return None
@@ -1,10 +1,36 @@
 import requests
 import asyncio
+import gzip
+import hashlib
+import os
+import time
 import aiohttp
+from services.event_service import EventService
+from services import json_codec
 
-SKI123_URL = "http://10.3.226.131/Info"
-VPS_URL = "http://89.208.105.93:5050/api/push"
-SECRET_TOKEN = "MY_SECRET_TOKEN"
+try:
+    import zstandard
+except ImportError:  # необязательная зависимость — без неё пакеты сжимаются gzip
+    zstandard = None
+
+SKI123_URL = os.environ.get("SKI123_URL", "http://10.3.226.131/Info")
+VPS_URL = os.environ.get("VPS_URL", "http://89.208.105.93:5050/api/push")
+SECRET_TOKEN = os.environ.get("SECRET_TOKEN", "MY_SECRET_TOKEN")
+
+PUSH_INTERVAL = 3      # сек между началами циклов сбора
+CONCURRENCY = 8        # одновременных SOAP-запросов к Ski123
+SOAP_TIMEOUT = 2.5     # сек на один запрос — цикл должен уложиться в PUSH_INTERVAL
+
+# Сжатие тела push (XML сжимается примерно в 10 раз — канал с площадки часто слабый LTE):
+# zstd, если установлен zstandard, иначе gzip; PUSH_ENCODING=identity — без сжатия
+PUSH_ENCODING = os.environ.get("PUSH_ENCODING") or ("zstd" if zstandard is not None else "gzip")
+ENCODINGS = ("zstd", "gzip", "identity")  # порядок перехода, если VPS сжатие не принял
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 6
+ENCODING_RETRY = 600   # сек: перешли на другое сжатие — столько спустя снова пробуем PUSH_ENCODING
+
+GET_EVENTDATA = "http://tempuri.org/iInfoInterface/GetEventData"
+GET_RESULT = "http://tempuri.org/iInfoInterface/GetResult"
 
 HEADERS = {
     "Content-Type": "text/xml; charset=utf-8",
@@ -23,25 +49,182 @@ async def soap_call(session, action, body):
     </soap:Envelope>"""
 
     async with session.post(SKI123_URL, data=envelope.encode("utf-8"), headers=headers) as resp:
+        # SOAP Fault приходит с HTTP 500 — это ошибка, а не протокол для VPS
+        resp.raise_for_status()
         return await resp.text()
 
+def content_hash(text):
+    """sha1 документа — VPS сравнивает его с тем, что уже получил."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def build_push(event_xml, results, sent):
+    """
+    Дельта-пакет: хеши всех документов + тела только тех, чей хеш
+    отличается от подтверждённого VPS (sent). sent = {} — полный пакет.
+    """
+    hashes = {
+        "event_xml": content_hash(event_xml),
+        "results": {key: content_hash(xml) for key, xml in results.items()}
+    }
+    payload = {"hashes": hashes}
+    if hashes["event_xml"] != sent.get("event_xml"):
+        payload["event_xml"] = event_xml
+    sent_results = sent.get("results", {})
+    changed = {key: results[key] for key, h in hashes["results"].items() if sent_results.get(key) != h}
+    if changed:
+        payload["results"] = changed
+    return payload, hashes
+
+def encode_push(payload, encoding):
+    """Тело push: JSON (utf-8), сжатый encoding."""
+    body = json_codec.dumps(payload)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    if encoding == "gzip":
+        return gzip.compress(body, GZIP_LEVEL, mtime=0)
+    return body
+
+def push(payload, encoding="identity"):
+    headers = {"Authorization": f"Bearer {SECRET_TOKEN}", "Content-Type": "application/json"}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return requests.post(VPS_URL, data=encode_push(payload, encoding), headers=headers, timeout=10)
+
+def fallback_encoding(resp, encoding, confirmed=False):
+    """
+    Следующее сжатие, если VPS не принял encoding: 415 (в Accept-Encoding — что он умеет)
+    или 400 от старого VPS без распаковки — только пока VPS ещё не принимал encoding
+    (confirmed): потом 400 — ошибка в самом пакете. None — повторять не нужно.
+    """
+    if encoding == "identity" or not (resp.status_code == 415 or (resp.status_code == 400 and not confirmed)):
+        return None
+    accepted = [e.strip() for e in resp.headers.get("Accept-Encoding", "").split(",") if e.strip()]
+    for candidate in ENCODINGS[ENCODINGS.index(encoding) + 1:]:
+        if not accepted or candidate in accepted:
+            return candidate
+    return "identity"
+
+class PushEncoding:
+    """
+    Сжатие, которым отправляются пакеты. Отказ VPS (fallback_encoding) — переход
+    к следующему; спустя ENCODING_RETRY сек снова пробуем preferred: VPS могли обновить.
+    """
+
+    def __init__(self, preferred=PUSH_ENCODING, clock=time.monotonic):
+        self.preferred = preferred
+        self.current = preferred
+        self.confirmed = False   # VPS уже принимал пакет с current
+        self._clock = clock
+        self._fallback_at = None
+
+    def for_push(self):
+        """Сжатие для очередного пакета."""
+        if self.current != self.preferred and self._clock() - self._fallback_at >= ENCODING_RETRY:
+            self.current, self.confirmed = self.preferred, False
+        return self.current
+
+    def on_response(self, resp):
+        """Учесть ответ VPS. Сжатие, с которым пакет надо повторить, или None."""
+        fallback = fallback_encoding(resp, self.current, self.confirmed)
+        if fallback is not None:
+            self.current, self.confirmed, self._fallback_at = fallback, False, self._clock()
+        elif resp.ok or resp.status_code == 409:
+            # 409 — пакет распакован и разобран, просто нужна полная пересылка
+            self.confirmed = True
+        return fallback
+
+def result_body(race_id, ranking_nr):
+    return f"""
+    <GetResult xmlns="http://tempuri.org/">
+        <RaceId>{race_id}</RaceId>
+        <RankingNr>{ranking_nr}</RankingNr>
+        <CatId></CatId>
+        <AttId></AttId>
+    </GetResult>
+    """
+
+def result_keys(schedule):
+    """Пары (RaceId, RankingNr) для всех гонок; старт (RankingNr = 1) нужен всегда."""
+    keys = []
+    for race in schedule:
+        ranking_nrs = ["1"] + [r["RankingNr"] for r in race.get("Rankings", []) if r["RankingNr"] != "1"]
+        for ranking_nr in ranking_nrs:
+            keys.append((race["RaceId"], ranking_nr))
+    return keys
+
+async def collect_results(session, schedule, previous):
+    """
+    GetResult для всех гонок и рейтингов одновременно (не более CONCURRENCY запросов).
+    Если запрос не удался — остаётся прошлый ответ из previous.
+    """
+    sem = asyncio.Semaphore(CONCURRENCY)
+
+    async def fetch(race_id, ranking_nr):
+        async with sem:
+            return await soap_call(session, GET_RESULT, result_body(race_id, ranking_nr))
+
+    keys = result_keys(schedule)
+    responses = await asyncio.gather(*(fetch(race_id, nr) for race_id, nr in keys), return_exceptions=True)
+
+    results = {}
+    failed = 0
+    for (race_id, ranking_nr), xml in zip(keys, responses):
+        key = f"{race_id}_{ranking_nr}"
+        if isinstance(xml, BaseException) or not xml:
+            failed += 1
+            xml = previous.get(key)
+        if xml:
+            results[key] = xml
+    if failed:
+        print(f"GetResult: {failed} из {len(keys)} запросов не удались")
+    return results
+
 async def main():
-    async with aiohttp.ClientSession() as session:
+    sent = {}  # хеши документов, которые VPS подтвердил
+    encoding = PushEncoding()
+    event_svc = EventService()
+    xml = None
+    results = {}
+    timeout = aiohttp.ClientTimeout(total=SOAP_TIMEOUT)
+    async with aiohttp.ClientSession(timeout=timeout, connector=aiohttp.TCPConnector(limit=CONCURRENCY)) as session:
         while True:
-            xml = await soap_call(
-                session,
-                "http://tempuri.org/iInfoInterface/GetEventData",
-                "<GetEventData xmlns='http://tempuri.org/'/>"
-            )
+            started = time.monotonic()
+            try:
+                xml = await soap_call(session, GET_EVENTDATA, "<GetEventData xmlns='http://tempuri.org/'/>")
+            except Exception as e:
+                # без свежего GetEventData работаем по прошлому
+                print("SOAP ERROR:", e)
 
-            requests.post(
-                VPS_URL,
-                json={"event_xml": xml},
-                headers={"Authorization": f"Bearer {SECRET_TOKEN}"}
-            )
+            data = event_svc.parse_event_xml(xml)
+            if data:
+                results = await collect_results(session, data["schedule"], results)
 
-            print("Отправлено")
+            if xml:
+                payload, hashes = build_push(xml, results, sent)
+                try:
+                    current = encoding.for_push()
+                    resp = push(payload, current)
+                    fallback = encoding.on_response(resp)
+                    while fallback is not None:
+                        print(f"VPS не принял {current}, дальше — {fallback}")
+                        current = fallback
+                        resp = push(payload, current)
+                        fallback = encoding.on_response(resp)
+                    if resp.status_code == 409:
+                        # VPS не знает базовую версию (перезапуск и т.п.) — шлём всё целиком
+                        payload, hashes = build_push(xml, results, {})
+                        resp = push(payload, current)
+                        encoding.on_response(resp)
+                    if resp.ok:
+                        sent = hashes
+                        size = len(resp.request.body or b"") / 1024
+                        print(f"Отправлено: {len(results)} протоколов, {size:.0f} КБ, {time.monotonic() - started:.2f} с")
+                    else:
+                        print("PUSH ERROR:", resp.status_code)
+                except requests.RequestException as e:
+                    print("PUSH ERROR:", e)
 
-            await asyncio.sleep(3)
+            await asyncio.sleep(max(0.0, PUSH_INTERVAL - (time.monotonic() - started)))
 
-asyncio.run(main())
+if __name__ == "__main__":
+    asyncio.run(main())